@@ -1,14 +1,40 @@
-from flask import Flask, render_template, request, redirect, url_for, flash , session
+from flask import (Flask, render_template, request, redirect, url_for, flash , session,
+                   Response, stream_with_context, abort, jsonify, make_response)
 from models import (
-    db, # Meal, Restaurant暫時刪除
+    db, dialect_insert, ensure_schema, normalize_code, normalize_name, # Meal, Restaurant暫時刪除
     OrderGroup,VoteGroup,# 兩種群組
     OrderRestaurant, OrderFavorite, # 訂餐用
     VoteRestaurant, VoteResult,   # 投票用
     OrderComment, VoteComment, # 留言
-    VoteGroupMeta,VoteBallot ,VoteToken)  # 聚餐投票 - 群組設定.投票規則
+    VoteGroupMeta, VoteLedger,  # 聚餐投票 - 群組設定.投票規則、選票帳本
+    GroupVersion)  # 輪詢用版本號
+from comment_bus import comment_bus
+from engine import resolve_profile, engine_options, configure_engine
+from group_cache import GroupCache, GroupRef, VoteMeta
+from tally import TallyBuffer, reconcile, reconcile_closed
+from metrics import Metrics
+from catalog import CatalogSearch, backfill_catalog
+from sessions import DbSessionInterface
+from ratelimit import RateLimiter
+from bulk import ImportRejected, parse_restaurants, import_restaurants, copy_restaurants, iter_export
+import votes
+from codes import CodeAllocator, derive_key
+from loaders import load_order_page, load_vote_page
+from snapshots import load_snapshot, freeze_results
+from assets import Assets, build_assets
+from compression import init_compression
+from retention import ActivityTracker, GroupArchived, archive_idle_order_groups, guard_order_group, restore_order_group
+from sharding import ShardMap, shard_urls, shard_context, use_shard, each_shard, rebalance
+from replica import ReplicaRouter, sync_sqlite, use_primary
+from sweeper import expiry_cutoff_utc, sweep_expired_vote_groups, start_sweeper
 from datetime import datetime,timezone, timedelta
+from sqlalchemy.exc import IntegrityError
+import click
+import functools
+import zlib
+from flask.cli import AppGroup
 import os
-import random
+import time
 import uuid
 
 
@@ -21,49 +47,413 @@ def create_app():
         db_url = db_url.replace("postgres://", "postgresql://", 1) 
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True} # 避免閒置連線失效
+    # 連線設定檔（見 engine.py）：SQLite 開 WAL 等 PRAGMA，Postgres 依 worker 數配置連線池
+    app.config["DB_PROFILE"] = resolve_profile(db_url)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["DB_PROFILE"], db_url)
+    # SSE 單次連線最長秒數（sync worker 預設 timeout 30 秒，需小於它；瀏覽器會自動重連）
+    app.config["SSE_STREAM_SECONDS"] = int(os.environ.get("SSE_STREAM_SECONDS", 25))
+    # 留言 SSE 推送：每條連線佔住一個請求處理單位，只在 gthread / gevent worker 開啟（gunicorn.conf.py 依 profile 設定）；
+    # 關閉時頁面不給 SSE 網址，留言板改用每 5 秒一次的輪詢
+    app.config["SSE_ENABLED"] = os.environ.get("SSE_ENABLED", "0") == "1"
+    # 代碼 → 群組快取（每個 worker 各自一份）
+    app.config["GROUP_CACHE_SIZE"] = int(os.environ.get("GROUP_CACHE_SIZE", 2048))
+    app.config["GROUP_CACHE_TTL"] = float(os.environ.get("GROUP_CACHE_TTL", 300))
+    # 票數 write-behind：>0 時票數增量每 N 毫秒批次寫回（0 = 每票直接更新 VoteResult）
+    app.config["TALLY_WRITE_BEHIND_MS"] = int(os.environ.get("TALLY_WRITE_BEHIND_MS", 0))
+    # 單一請求 SQL 次數上限（超過記 warning；0 = 不檢查）
+    app.config["QUERY_BUDGET"] = int(os.environ.get("QUERY_BUDGET", 0))
+    # 背景清理過期投票群組的間隔秒數（0 = 不啟動，改用 `flask sweep-expired` 排程）
+    app.config["SWEEP_INTERVAL_SECONDS"] = float(os.environ.get("SWEEP_INTERVAL_SECONDS", 0))
+    # 訂餐群組超過幾天沒人開啟就由 sweeper 封存（0 = 不自動封存，改用 `flask archive-idle` 排程）
+    app.config["ARCHIVE_IDLE_DAYS"] = int(os.environ.get("ARCHIVE_IDLE_DAYS", 0))
+
+    # 餐廳搜尋：記憶體前綴樹放幾筆最熱門的目錄項目、幾秒重建一次
+    app.config["CATALOG_TRIE_SIZE"] = int(os.environ.get("CATALOG_TRIE_SIZE", 5000))
+    app.config["CATALOG_TRIE_TTL"] = float(os.environ.get("CATALOG_TRIE_TTL", 600))
+
+    # session 存放位置：cookie（預設，Flask 簽章 cookie）或 db（cookie 只放 id，見 sessions.py）
+    app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "cookie")
+    app.config["SESSION_MAX_AGE_DAYS"] = int(os.environ.get("SESSION_MAX_AGE_DAYS", 30))
+
+    # 寫入限流（見 ratelimit.py）："N/S" = 每個使用者在每個群組 S 秒內最多 N 次，0 = 不限制
+    app.config["RATE_LIMIT_COMMENT"] = os.environ.get("RATE_LIMIT_COMMENT", "5/10")
+    app.config["RATE_LIMIT_VOTE"] = os.environ.get("RATE_LIMIT_VOTE", "10/10")
+    app.config["RATE_LIMIT_BACKEND"] = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+
+    # 邀請代碼：最短長度、每次向資料庫預約的序號數、置換金鑰（預設由 SECRET_KEY 衍生）
+    app.config["INVITE_CODE_LENGTH"] = int(os.environ.get("INVITE_CODE_LENGTH", 6))
+    app.config["CODE_BLOCK_SIZE"] = int(os.environ.get("CODE_BLOCK_SIZE", 64))
+    app.config["INVITE_CODE_KEY"] = os.environ.get("INVITE_CODE_KEY") or app.config["SECRET_KEY"]
+
+    # 回應壓縮：HTML／JSON 超過幾個位元組才 gzip（0 = 關閉，交給前端 proxy）
+    app.config["GZIP_MIN_BYTES"] = int(os.environ.get("GZIP_MIN_BYTES", 500))
+    app.config["GZIP_LEVEL"] = int(os.environ.get("GZIP_LEVEL", 6))
+    # 靜態檔指紋化（見 assets.py）：啟動時若 static/ 比 manifest 新就重建；部署時可關閉改跑 `flask assets build`
+    app.config["ASSET_AUTOBUILD"] = os.environ.get("ASSET_AUTOBUILD", "1") == "1"
+
+    # SQLite 分片數（見 sharding.py）：>1 時群組依代碼雜湊分散到多個資料庫檔
+    app.config["SQLITE_SHARDS"] = int(os.environ.get("SQLITE_SHARDS", 1))
+    if app.config["SQLITE_SHARDS"] > 1:
+        app.config["SQLALCHEMY_BINDS"] = {f"shard{i}": url for i, url
+                                          in enumerate(shard_urls(db_url, app.config["SQLITE_SHARDS"])) if i}
+
+    # 讀取副本（見 replica.py）：GET 的查詢走副本；落後超過 MAX_LAG 秒或連不上時改回主庫
+    app.config["READ_DATABASE_URL"] = os.environ.get("READ_DATABASE_URL", "").replace("postgres://", "postgresql://", 1)
+    app.config["READ_REPLICA_MAX_LAG_SECONDS"] = float(os.environ.get("READ_REPLICA_MAX_LAG_SECONDS", 5))
+    app.config["READ_REPLICA_CHECK_SECONDS"] = float(os.environ.get("READ_REPLICA_CHECK_SECONDS", 1))
+    if read_url := app.config["READ_DATABASE_URL"]:
+        app.config.setdefault("SQLALCHEMY_BINDS", {})["replica"] = {
+            "url": read_url, **engine_options(resolve_profile(read_url), read_url)}
 
     db.init_app(app)
+    assets = Assets()
+    assets.init_app(app, app.config["ASSET_AUTOBUILD"])
+    init_compression(app, app.config["GZIP_MIN_BYTES"], app.config["GZIP_LEVEL"])
+    if app.config["SESSION_BACKEND"] == "db":
+        app.session_interface = app.extensions["session_store"] = DbSessionInterface(
+            app.config["SESSION_MAX_AGE_DAYS"])
+    elif app.config["SESSION_BACKEND"] != "cookie":
+        raise RuntimeError(f"unknown SESSION_BACKEND: {app.config['SESSION_BACKEND']!r} (cookie / db)")
+    groups = app.extensions["group_cache"] = GroupCache(app.config["GROUP_CACHE_SIZE"],
+                                                        app.config["GROUP_CACHE_TTL"])
 
     MAX_RESTAURANTS = 10
     MIN_RESTAURANTS = 1
+    COMMENT_KEEP = 50         # 留言板顯示／保留的筆數
+    COMMENT_HIGH_WATER = 60   # 超過這個數量才修剪回 COMMENT_KEEP
+    NICKS_KEEP = 20           # session 只記最近使用的幾個群組暱稱
     TAIPEI = timezone(timedelta(hours=8))
 
+    shards = None
     with app.app_context():
-        db.create_all()
-
-
+        if app.config["SQLITE_SHARDS"] > 1:
+            shards = ShardMap(app.config["SQLITE_SHARDS"])
+            shards.init_app(app, db)
+        for engine in (shards.engines if shards else [db.engine]):
+            configure_engine(engine, app.config["DB_PROFILE"])   # 在 create_all 開第一條連線之前
+        db.create_all(bind_key=None)
+        ensure_schema()
+        if shards:
+            group_tables = shards.group_tables(db.metadata)
+            for index, engine in enumerate(shards.engines[1:], start=1):
+                db.metadata.create_all(engine, tables=group_tables)
+                with shard_context(index):
+                    ensure_schema(engine, group_tables)
+        if db.inspect(db.engine).has_table("vote_token"):
+            app.logger.warning("legacy vote_token/vote_ballot tables found: run `flask votes migrate-ledger`")
+        else:   # ledger 還沒搬完之前不能拿來對帳
+            # 上次被強制結束的 worker 沒寫回的增量：已截止、尚未凍結的群組以 ledger 補正（見 tally.py）
+            reconcile_closed(timedelta(milliseconds=2 * app.config["TALLY_WRITE_BEHIND_MS"]))
+        comment_bus.init_app(app, db.engine)
+        metrics = Metrics(app.config["QUERY_BUDGET"])
+        metrics.init_app(app, db.engine)
+        for engine in (shards.engines[1:] if shards else ()):
+            metrics.watch_engine(engine)
+        replica = None
+        if read_url:
+            replica = ReplicaRouter(app.config["READ_REPLICA_MAX_LAG_SECONDS"], app.config["READ_REPLICA_CHECK_SECONDS"])
+            configure_engine(db.engines["replica"], resolve_profile(read_url))
+            replica.init_app(app, db.engine, db.engines["replica"])
+            metrics.watch_engine(replica.engine)
+            metrics.add_collector(replica.stats)
+        metrics.add_collector(lambda: [
+            ("group_cache_hits_total", "counter", {}, groups.hits),
+            ("group_cache_misses_total", "counter", {}, groups.misses),
+            ("group_cache_size", "gauge", {}, groups.stats()["size"]),
+        ])
+
+    codes = app.extensions["code_allocator"] = CodeAllocator(derive_key(app.config["INVITE_CODE_KEY"]),
+                                                             app.config["INVITE_CODE_LENGTH"],
+                                                             app.config["CODE_BLOCK_SIZE"])
+    limiter = app.extensions["rate_limiter"] = RateLimiter(
+        {"comment": app.config["RATE_LIMIT_COMMENT"], "vote": app.config["RATE_LIMIT_VOTE"]},
+        app.config["RATE_LIMIT_BACKEND"])
+
+    tallies = None
+    if app.config["TALLY_WRITE_BEHIND_MS"] > 0:
+        tallies = app.extensions["tally_buffer"] = TallyBuffer(app, app.config["TALLY_WRITE_BEHIND_MS"])
+
+    activity = ActivityTracker()
+
+    if app.config["SWEEP_INTERVAL_SECONDS"] > 0:
+        start_sweeper(app, app.config["SWEEP_INTERVAL_SECONDS"])
+
+    catalog = app.extensions["catalog_search"] = CatalogSearch(app.config["CATALOG_TRIE_SIZE"],
+                                                              app.config["CATALOG_TRIE_TTL"])
+
+    restaurants_cli = AppGroup("restaurants", help="餐廳清單批次匯入／匯出。")
+
+    @restaurants_cli.command("import")
+    @click.argument("scope", type=click.Choice(["order", "vote"]))
+    @click.argument("code")
+    @click.argument("file", type=click.File("r", encoding="utf-8-sig"))
+    def restaurants_import_command(scope, code, file):
+        """從 CSV / JSON 檔匯入餐廳到群組（整批一個交易）。"""
+        group = get_order_group(code) if scope == "order" else get_vote_group(code)
+        if not group:
+            raise click.ClickException(f"group not found: {code}")
+        model = OrderRestaurant if scope == "order" else VoteRestaurant
+        fmt = "json" if file.name.lower().endswith(".json") else "csv"
+        try:
+            added, skipped = import_restaurants(model, group.id, parse_restaurants(file.read(), fmt), MAX_RESTAURANTS)
+        except ImportRejected as e:
+            db.session.rollback()
+            raise click.ClickException(str(e))
+        db.session.commit()
+        click.echo(f"imported {added}, skipped {skipped} duplicates")
+
+    @restaurants_cli.command("export")
+    @click.argument("scope", type=click.Choice(["order", "vote"]))
+    @click.argument("code")
+    @click.option("--format", "fmt", type=click.Choice(["csv", "json"]), default="csv", show_default=True)
+    def restaurants_export_command(scope, code, fmt):
+        """把群組的餐廳（訂餐群組含常訂）輸出到 stdout。"""
+        group = get_order_group(code) if scope == "order" else get_vote_group(code)
+        if not group:
+            raise click.ClickException(f"group not found: {code}")
+        for chunk in iter_export(OrderRestaurant if scope == "order" else VoteRestaurant, group.id, fmt):
+            click.echo(chunk, nl=False)
+
+    @restaurants_cli.command("backfill-catalog")
+    @click.option("--batch-size", default=500, show_default=True)
+    def restaurants_backfill_catalog_command(batch_size):
+        """把既有群組餐廳連到共用餐廳目錄（可重複執行）。"""
+        click.echo(f"linked {backfill_catalog(batch_size)} restaurants")
+
+    app.cli.add_command(restaurants_cli)
+
+    assets_cli = AppGroup("assets", help="靜態檔指紋化與預先壓縮。")
+
+    @assets_cli.command("build")
+    def assets_build_command():
+        """產生 static/dist/ 下的指紋檔、.gz 與 manifest.json。"""
+        for name, info in sorted(build_assets(app.static_folder).items()):
+            click.echo(f"{name} -> {info['path']} ({info['bytes']} B, gzip {info['gzip_bytes']} B)")
+        assets.load()
+
+    app.cli.add_command(assets_cli)
+
+    @app.cli.command("sweep-expired")
+    @click.option("--batch-size", default=200, show_default=True, help="每個交易處理的群組數")
+    def sweep_expired_command(batch_size):
+        """刪除所有已過期的聚餐投票群組（含餐廳、票數、留言等關聯資料）。"""
+        removed = sweep_expired_vote_groups(batch_size=batch_size)
+        if "session_store" in app.extensions and (purged := app.extensions["session_store"].purge()):
+            removed["server_session"] = purged
+        if not removed:
+            click.echo("no expired vote groups")
+        for table, n in sorted(removed.items()):
+            click.echo(f"{table}: {n}")
+
+    shards_cli = AppGroup("shards", help="SQLite 分片（SQLITE_SHARDS）維護。")
+
+    @shards_cli.command("rebalance")
+    @click.option("--batch-size", default=500, show_default=True, help="每次讀取的群組數")
+    def shards_rebalance_command(batch_size):
+        """把不在家（crc32(代碼) % SQLITE_SHARDS）的群組連同子資料搬回家；請在停機或暫停寫入時執行。"""
+        if not shards:
+            raise click.ClickException("SQLITE_SHARDS is not > 1")
+        moved = rebalance(db.metadata, shards, batch_size)
+        groups.clear()
+        if not moved:
+            click.echo("all groups are on their home shard")
+        for route, n in sorted(moved.items()):
+            click.echo(f"{route}: {n}")
+
+    @shards_cli.command("stats")
+    def shards_stats_command():
+        """各分片的群組數。"""
+        for index in each_shard():
+            click.echo(f"shard{index}: {OrderGroup.query.count()} order / {VoteGroup.query.count()} vote groups")
+
+    app.cli.add_command(shards_cli)
+
+    replica_cli = AppGroup("replica", help="讀取副本（READ_DATABASE_URL）。")
+
+    @replica_cli.command("status")
+    def replica_status_command():
+        """寫一次心跳並回報副本是否可用與延遲秒數。"""
+        if not replica:
+            raise click.ClickException("READ_DATABASE_URL is not set")
+        healthy = replica.check()
+        lag = "unknown" if replica.lag is None else f"{replica.lag:.1f}s"
+        click.echo(f"{'healthy' if healthy else 'unavailable'}: lag {lag} "
+                   f"(max {app.config['READ_REPLICA_MAX_LAG_SECONDS']:g}s)")
+
+    @replica_cli.command("sync")
+    def replica_sync_command():
+        """本機測試用（僅 SQLite）：把主庫整個複製到副本檔。"""
+        if not replica:
+            raise click.ClickException("READ_DATABASE_URL is not set")
+        if db.engine.dialect.name != "sqlite" or replica.engine.dialect.name != "sqlite":
+            raise click.ClickException("replica sync only copies SQLite files; use the database's own replication")
+        sync_sqlite(db.engine, replica.engine)
+        click.echo(f"copied {db.engine.url.database} -> {replica.engine.url.database}")
+
+    app.cli.add_command(replica_cli)
+
+    votes_cli = AppGroup("votes", help="投票資料維護。")
+
+    @votes_cli.command("migrate-ledger")
+    def votes_migrate_ledger_command():
+        """把舊版 vote_token / vote_ballot 搬進 vote_ledger 並刪除舊表（單一交易，可重複執行）。"""
+        moved = votes.migrate_legacy_votes()
+        click.echo("no legacy vote tables" if moved is None else f"vote_ledger: {moved} ballots migrated")
+
+    app.cli.add_command(votes_cli)
+
+    @app.cli.command("archive-idle")
+    @click.option("--days", type=int, default=lambda: app.config["ARCHIVE_IDLE_DAYS"] or 180,
+                  show_default="ARCHIVE_IDLE_DAYS 或 180", help="超過幾天沒人開啟的訂餐群組")
+    @click.option("--batch-size", default=100, show_default=True, help="每個交易處理的群組數")
+    def archive_idle_command(days, batch_size):
+        """把閒置的訂餐群組（含餐廳、常訂、留言）壓縮移到封存表；用原代碼開啟時自動還原。"""
+        moved = archive_idle_order_groups(days, batch_size=batch_size)
+        if not moved:
+            click.echo("no idle order groups")
+        for table, n in sorted(moved.items()):
+            click.echo(f"{table}: {n}")
+
+
+
+    # 建立群組並配發代碼（codes.py：序號置換，本身不會重複）
+    def create_group(model, name: str, populate=None):
+        """建立群組（populate(group) 在同一個交易內補上 meta、複製餐廳）並 commit。
+
+        不用 SAVEPOINT：pysqlite 在交易開頭的 SAVEPOINT 沒有外層 BEGIN，RELEASE 就會先把群組 commit 掉。
+        代碼撞到改版前隨機產生的舊代碼時整筆 rollback，換下一個序號重來。
+        """
+        for _ in range(3):
+            group = model(code=codes.next_code(), name=name)
+            if shards:
+                use_shard(shards.home(group.code))   # 新群組放在代碼的家
+            try:
+                db.session.add(group)
+                db.session.flush()
+                if populate:
+                    populate(group)
+                db.session.commit()
+                return group
+            except IntegrityError:
+                db.session.rollback()
+        raise RuntimeError("could not allocate a unique invite code")
 
-    # 產生代碼（僅英數，避開易混淆字元）
-    def _gen_code(n=6):
-        alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # 不含易混淆字元
-        return "".join(random.choice(alphabet) for _ in range(n))
+    def search_shards(code: str):
+        return shards.search_order(code) if shards else (0,)
 
-    # 依代碼找「訂餐揪團」群組；無或不存在 → 回 None
+    # 依代碼找「訂餐揪團」群組；無或不存在 → 回 None（結果為唯讀 GroupRef，經 group_cache 快取）
     def get_order_group(code: str | None):
         if not code:
             return None
-        return OrderGroup.query.filter(db.func.lower(OrderGroup.code) == (code or "").lower()).first()
+        code = normalize_code(code)
+
+        def load():
+            for index in search_shards(code):
+                with shard_context(index):
+                    g = OrderGroup.query.filter_by(code=code).first() or restore_archived(code)
+                    if g:   # 還原時 commit 讓 g 過期：要在切回原分片之前讀出屬性
+                        return GroupRef(g.id, g.code, g.name, "order", shard=index)
+            return None
+
+        from_replica = replica and replica.serving(db.session)
+        group = groups.get("order", code, load)
+        if group is None and from_replica:
+            use_primary()   # 副本可能還沒有剛建立的群組
+            group = groups.get("order", code, load)
+        if group:
+            use_shard(group.shard)   # 之後這個請求的群組資料都在這個分片
+        return group
+
+    # 閒置後被封存的群組（retention.py）：用原代碼開啟時在同一個交易內還原
+    def restore_archived(code: str):
+        try:
+            g = restore_order_group(code)
+            if g is None:
+                return None
+            db.session.commit()
+            metrics.inc("order_groups_restored_total")
+            return g
+        except IntegrityError:   # 另一個請求同時還原了同一個代碼
+            db.session.rollback()
+            return OrderGroup.query.filter_by(code=code).first()
 
-    # 依代碼找「聚餐投票」群組；無或不存在 → 回 None
+    # 依代碼找「聚餐投票」群組（連同 meta 一次查回）；無或不存在 → 回 None
     def get_vote_group(code: str | None):
         if not code:
             return None
-        return VoteGroup.query.filter(db.func.lower(VoteGroup.code) == (code or "").lower()).first()
-    
+        code = normalize_code(code)
+
+        def load():
+            for index in search_shards(code):
+                with shard_context(index):
+                    row = (db.session.query(VoteGroup, VoteGroupMeta)
+                           .outerjoin(VoteGroupMeta, VoteGroupMeta.group_id == VoteGroup.id)
+                           .filter(VoteGroup.code == code)
+                           .first())
+                if row:
+                    g, m = row
+                    meta = VoteMeta(m.event_at, m.vote_deadline, m.votes_per_person) if m else None
+                    return GroupRef(g.id, g.code, g.name, "vote", meta, shard=index)
+            return None
+
+        from_replica = replica and replica.serving(db.session)
+        group = groups.get("vote", code, load)
+        if group is None and from_replica:
+            use_primary()
+            group = groups.get("vote", code, load)
+        if group:
+            use_shard(group.shard)
+        return group
+
+    def is_expired(group: GroupRef) -> bool:
+        """聚餐當天 23:59 後視為過期（實際刪除交給 sweeper）。"""
+        return bool(group.meta and to_aware_utc(group.meta.event_at) < expiry_cutoff_utc())
+
+    def order_group_or_404(code: str, write: bool = False):
+        group = get_order_group(code)
+        if not group:
+            abort(404)
+        if write:
+            guard_order_group(group.id)
+        return group
+
+    def order_write(view):
+        """訂餐群組的寫入路徑：群組可能剛被封存（其他 worker 快取的 GroupRef 還指向已刪除的 id），
+        guard_order_group 會丟出 GroupArchived；rollback、清掉快取後重跑一次，get_order_group 會從封存還原。"""
+        @functools.wraps(view)
+        def wrapped(code, **kwargs):
+            try:
+                return view(code, **kwargs)
+            except GroupArchived:
+                db.session.rollback()
+                groups.invalidate("order", normalize_code(code))
+                return view(code, **kwargs)
+        return wrapped
+
+    def vote_group_or_404(code: str):
+        group = get_vote_group(code)
+        if not group or is_expired(group):
+            abort(404)
+        return group
+
     # 暱稱：每位使用者在每個群組（與 scope）獨立設定，存於 session
     def _nick_key(scope: str, code: str) -> str:
         return f"{scope}:{(code or '').upper()}"
 
+    def _nicks() -> list[list[str]]:
+        """[[群組 key, 暱稱], ...]，最近設定的在最後（舊版 session 為 dict，讀到時轉換）。"""
+        nicks = session.get("nicks") or []
+        return [list(item) for item in nicks.items()] if isinstance(nicks, dict) else nicks
+
     def get_nick(scope: str, code: str) -> str | None:
-        nicks = session.get("nicks") or {}
-        return nicks.get(_nick_key(scope, code))
+        key = _nick_key(scope, code)
+        return next((nick for k, nick in _nicks() if k == key), None)
 
     def set_nick(scope: str, code: str, nickname: str):
         nickname = (nickname or "").strip()[:10] or "訪客"
-        nicks = session.get("nicks") or {}
-        nicks[_nick_key(scope, code)] = nickname
-        session["nicks"] = nicks
+        key = _nick_key(scope, code)
+        nicks = [item for item in _nicks() if item[0] != key] + [[key, nickname]]
+        session["nicks"] = nicks[-NICKS_KEEP:]
 
     def tw_time(dt):
         """將資料庫時間（假設為 UTC 或 naive 視為 UTC）顯示成台北時間 YYYY-MM-DD HH:MM。"""
@@ -82,19 +472,85 @@ def create_app():
             return dt.replace(tzinfo=timezone.utc)
         return dt.astimezone(timezone.utc)
 
-    def trim_comments(model, group_id: int, keep: int = 50):
-        """保留最新 keep 筆，刪掉更舊的（以 created_at 由新到舊排序）。"""
-        # 取出超出 keep 的那些 id（由新到舊 offset keep）
-        stale = (model.query
+    def bump_version(scope: str, group_id: int):
+        """群組版本號 +1（與本次寫入同一交易，由呼叫端 commit）。"""
+        stmt = dialect_insert(GroupVersion).values(scope=scope, group_id=group_id, version=1)
+        stmt = stmt.on_conflict_do_update(index_elements=["scope", "group_id"],
+                                          set_={"version": GroupVersion.version + 1})
+        db.session.execute(stmt)
+
+    def group_version(scope: str, code: str):
+        """回傳 (group_id, version)；群組走快取，命中時只需一次版本號的索引查詢。群組不存在 → 404。"""
+        group = order_group_or_404(code) if scope == "order" else vote_group_or_404(code)
+        version = (db.session.query(GroupVersion.version)
+                   .filter_by(scope=scope, group_id=group.id)
+                   .scalar())
+        return group.id, version or 0
+
+    def conditional(etag: str, build):
+        """If-None-Match 命中 → 直接 304，不查資料也不渲染；否則才呼叫 build() 產生回應。"""
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+        else:
+            resp = make_response(build())
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+
+    def current_votes(group_id: int) -> dict[int, int]:
+        """restaurant_id → 票數（含本 worker 尚未寫回的 write-behind 增量）。"""
+        votes_map = dict(db.session.query(VoteResult.vote_restaurant_id, VoteResult.votes)
+                         .filter_by(group_id=group_id).all())
+        if tallies:
+            for rid, n in tallies.pending(group_id).items():
+                votes_map[rid] = votes_map.get(rid, 0) + n
+        return votes_map
+
+    def vote_message(result: str, group: GroupRef) -> str:
+        return {
+            votes.CAST: "已投票！",
+            votes.CLOSED: "投票已截止。",
+            votes.ALREADY_VOTED: "你已經投過這家餐廳囉！",
+            votes.QUOTA_USED: f"每人限投 {group.meta.votes_per_person if group.meta else 1} 票，你已用完。",
+            votes.BUSY: "投票人數眾多，請再按一次。",
+            votes.NOT_FOUND: "找不到這家餐廳。",
+        }[result]
+
+    def comments_stream(scope: str, model, group_id: int, version: int):
+        """留言 HTML；帶 ?since=<id> 時只回比 since 新的留言（<li> 片段）。"""
+        since = request.args.get("since", type=int)
+
+        def build():
+            q = model.query.filter_by(group_id=group_id)
+            if since is not None:
+                comments = q.filter(model.id > since).order_by(model.id.asc()).limit(COMMENT_KEEP).all()
+                return render_template("partials/comment_items.html", comments=comments)
+            # 最新 COMMENT_KEEP 筆，由舊到新顯示
+            comments = q.order_by(model.created_at.desc()).limit(COMMENT_KEEP).all()[::-1]
+            return render_template("partials/comments_stream.html", comments=comments)
+
+        etag = f"{scope}-{group_id}-{version}" + (f"-s{since}" if since is not None else "")
+        return conditional(etag, build)
+
+    def trim_comments(model, group_id: int, keep: int = COMMENT_KEEP, high_water: int = COMMENT_HIGH_WATER):
+        """超過 high_water 筆才刪到只剩最新 keep 筆（與新增留言同一交易，由呼叫端 commit）。
+
+        平常只是一次 (group_id, created_at) 索引上的探查；大約每 high_water - keep 則留言才真的刪一次。
+        """
+        over = (db.session.query(model.id)
+                .filter_by(group_id=group_id)
+                .order_by(model.created_at.desc())
+                .offset(high_water)
+                .limit(1)
+                .first())
+        if not over:
+            return
+        stale = (db.session.query(model.id)
                  .filter_by(group_id=group_id)
                  .order_by(model.created_at.desc())
                  .offset(keep)
-                 .with_entities(model.id)
                  .all())
-        if stale:
-            ids = [sid for (sid,) in stale]
-            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
-            db.session.commit()
+        model.query.filter(model.id.in_([sid for (sid,) in stale])).delete(synchronize_session=False)
 
     def parse_local_to_utc(dt_local_str: str) -> datetime:
         """將 <input type=datetime-local> 傳回的 'YYYY-MM-DDTHH:MM' 視為台北時間，再轉 UTC。"""
@@ -106,24 +562,73 @@ def create_app():
         dt_local = dt_naive.replace(tzinfo=TAIPEI)
         return dt_local.astimezone(timezone.utc)
 
-    def cleanup_expired_vote_group(group: "VoteGroup"):
-        if not group or not group.meta:
-            return
-        # 先把 event_at 轉成 aware UTC
-        event_at_utc = to_aware_utc(group.meta.event_at)
-        # 轉台北，再取當天 23:59
-        event_local = event_at_utc.astimezone(TAIPEI)
-        event_end_local = event_local.replace(hour=23, minute=59, second=0, microsecond=0)
-        event_end_utc = event_end_local.astimezone(timezone.utc)
-
-        if datetime.now(timezone.utc) >= event_end_utc:
-            # 刪關聯
-            VoteBallot.query.filter_by(group_id=group.id).delete(synchronize_session=False)
-            VoteResult.query.filter_by(group_id=group.id).delete(synchronize_session=False)
-            VoteRestaurant.query.filter_by(group_id=group.id).delete(synchronize_session=False)
-            VoteGroupMeta.query.filter_by(group_id=group.id).delete(synchronize_session=False)
-            db.session.delete(group)
-            db.session.commit()
+    def events_url(endpoint: str, code: str) -> str | None:
+        return url_for(endpoint, code=code) if app.config["SSE_ENABLED"] else None
+
+    def comment_events(model, group_id: int, key: str):
+        """SSE：只推送 id 大於游標的新留言；游標取自 Last-Event-ID（重連）或 ?since=。"""
+        if not app.config["SSE_ENABLED"]:
+            abort(404)   # 舊頁面的 EventSource 收到非 event-stream 會停止重連，改回輪詢
+        try:
+            cursor = int(request.headers.get("Last-Event-ID") or request.args.get("since") or 0)
+        except ValueError:
+            cursor = 0
+        stream_seconds = app.config["SSE_STREAM_SECONDS"]
+        use_primary()   # 收到通知時留言已在主庫，副本可能還沒有
+
+        @stream_with_context
+        def generate():
+            nonlocal cursor
+            yield "retry: 2000\n\n"
+            end = time.monotonic() + stream_seconds
+            while True:
+                seen = comment_bus.version(key)
+                rows = (model.query
+                        .filter(model.group_id == group_id, model.id > cursor)
+                        .order_by(model.id.asc())
+                        .limit(COMMENT_KEEP).all())
+                html = render_template("partials/comment_items.html", comments=rows) if rows else None
+                db.session.close()  # 等待期間不佔用連線
+                if rows:
+                    cursor = rows[-1].id
+                    data = "".join(f"data: {line}\n" for line in html.splitlines() if line.strip())
+                    yield f"id: {cursor}\nevent: comments\n{data}\n"
+                    if len(rows) == COMMENT_KEEP:
+                        continue  # 可能還有更多，直接接著送
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return
+                if not comment_bus.wait(key, seen, min(remaining, 15)):
+                    yield ": ping\n\n"
+
+        return Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    def restaurants_import(scope: str, group, model):
+        """批次匯入（上傳檔案或貼上文字，CSV / JSON），整批一個交易。"""
+        upload = request.files.get("file")
+        if upload and upload.filename:
+            data = upload.read().decode("utf-8-sig", errors="replace")
+            fmt = "json" if upload.filename.lower().endswith(".json") else "csv"
+        else:
+            data = request.form.get("data") or ""
+            fmt = "json" if data.lstrip().startswith("[") else "csv"
+        try:
+            added, skipped = import_restaurants(model, group.id, parse_restaurants(data, fmt), MAX_RESTAURANTS)
+        except ImportRejected as e:
+            db.session.rollback()
+            flash(str(e), "error")
+            return redirect(url_for(f"{'og' if scope == 'order' else 'vg'}_add_restaurant", code=group.code))
+        db.session.commit()
+        flash(f"已匯入 {added} 家餐廳" + (f"，略過重複 {skipped} 家" if skipped else "") + "。", "success")
+        return redirect(url_for(scope, code=group.code))
+
+    def restaurants_export(group, model):
+        """串流匯出 CSV（預設）或 ?format=json。"""
+        fmt = "json" if request.args.get("format") == "json" else "csv"
+        return Response(stream_with_context(iter_export(model, group.id, fmt)),
+                        mimetype="application/json" if fmt == "json" else "text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="{group.code}-restaurants.{fmt}"'})
 
     def get_client_id() -> str:
         cid = session.get("cid")
@@ -154,35 +659,61 @@ def create_app():
                 "order.html",
                 group=None, restaurants=[], fav_ids=set(),
                 scope="order", saved_nick=None,
-                comments_stream_url=None, comment_post_url=None
+                comments_stream_url=None, comments_events_url=None, comment_post_url=None
             )
 
-        restaurants = OrderRestaurant.query.filter_by(group_id=group.id).order_by(OrderRestaurant.name.asc()).all()
-        fav_ids = {f.order_restaurant_id for f in OrderFavorite.query.filter_by(group_id=group.id).all()}
+        get_client_id()  # 先發 cid：之後留言／投票的限流以 cid 區分，不會同 IP（同辦公室）共用額度
+        activity.touch(group.id)  # 每天最多一句 UPDATE，閒置封存依此判斷
+        page = load_order_page(group.id)  # 餐廳與常訂一句查詢
 
         return render_template(
             "order.html",
-            group=group, restaurants=restaurants, fav_ids=fav_ids,
+            group=group, restaurants=page.restaurants, fav_ids=page.fav_ids,
             scope="order",
             saved_nick=get_nick("order", group.code),
             comments_stream_url=url_for("og_comments_stream", code=group.code),
+            comments_events_url=events_url("og_comments_events", group.code),
             comment_post_url=url_for("og_post_comment", code=group.code)
         )
 
     # 訂餐揪團：留言串流（右側自動刷新抓這個部分 HTML）
     @app.route("/og/<code>/comments/stream", methods=["GET"])
     def og_comments_stream(code):
-        group = OrderGroup.query.filter_by(code=code).first_or_404()
-        comments = (OrderComment.query
-                    .filter_by(group_id=group.id)
-                    .order_by(OrderComment.created_at.asc())
-                    .limit(50).all())
-        return render_template("partials/comments_stream.html", comments=comments)
+        group_id, version = group_version("order", code)
+        return comments_stream("order", OrderComment, group_id, version)
+
+    # 訂餐揪團：留言即時推送（SSE；不支援時前端退回上面的輪詢）
+    @app.route("/og/<code>/comments/events", methods=["GET"])
+    def og_comments_events(code):
+        group = order_group_or_404(code)
+        return comment_events(OrderComment, group.id, f"order:{group.id}")
+
+    def rate_limited(action: str):
+        """超過限流直接回 429（在查群組、寫資料庫之前）；以 cid（伺服器端 session 則用 sid）或 IP 識別。"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapped(code, *args, **kwargs):
+                who = session.sid if hasattr(session, "sid") else session.get("cid")   # sid 不必載入 session 資料
+                if limiter.allow(action, f"{normalize_code(code)}:{who or 'ip:' + (request.remote_addr or '')}"):
+                    return view(code, *args, **kwargs)
+                metrics.inc("rate_limited_total", action=action, backend=limiter.backend)
+                message = "操作太頻繁，請稍後再試。"
+                if request.path.startswith("/api/"):
+                    resp = jsonify(ok=False, error="rate_limited", message=message)
+                else:
+                    resp = Response(message, mimetype="text/plain")
+                resp.status_code = 429
+                resp.headers["Retry-After"] = str(limiter.retry_after(action))
+                return resp
+            return wrapped
+        return decorator
 
     # 訂餐揪團：新增留言（同時可更新暱稱）
     @app.route("/og/<code>/comments", methods=["POST"])
+    @rate_limited("comment")
+    @order_write
     def og_post_comment(code):
-        group = OrderGroup.query.filter_by(code=code).first_or_404()
+        group = order_group_or_404(code, write=True)
         nickname = (request.form.get("nickname") or "").strip()
         message = (request.form.get("message") or "").strip()
 
@@ -197,14 +728,17 @@ def create_app():
         message = message[:30]  # ← 最多 30
 
         db.session.add(OrderComment(group_id=group.id, nickname=nickname, message=message))
+        comment_bus.publish(db.session, f"order:{group.id}")
+        bump_version("order", group.id)
+        trim_comments(OrderComment, group.id)
         db.session.commit()
-        trim_comments(OrderComment, group.id, keep=50)
         return redirect(url_for("order", code=code))
 
 
     @app.route("/og/<code>/restaurants/new", methods=["GET", "POST"])
+    @order_write
     def og_add_restaurant(code):
-        group = OrderGroup.query.filter_by(code=code).first_or_404()
+        group = order_group_or_404(code, write=request.method == "POST")
 
         if request.method == "POST":
             name = (request.form.get("name") or "").strip()
@@ -223,7 +757,7 @@ def create_app():
 
             exists = OrderRestaurant.query.filter(
                 OrderRestaurant.group_id == group.id,
-                db.func.lower(OrderRestaurant.name) == name.lower()
+                OrderRestaurant.name_key == normalize_name(name)
             ).first()
             if exists:
                 flash("此餐廳已存在於本群組。", "warning")
@@ -236,16 +770,34 @@ def create_app():
 
         return render_template("og_add_restaurant.html", group=group)
 
+    @app.route("/restaurants/search", methods=["GET"])
+    def restaurants_search():
+        """新增餐廳表單的自動完成：?q=名稱前綴，回傳共用目錄中最多 8 筆。"""
+        q = (request.args.get("q") or "").strip()[:60]
+        resp = jsonify(results=catalog.search(q) if q else [])
+        resp.headers["Cache-Control"] = "public, max-age=60"
+        return resp
+
+    @app.route("/og/<code>/restaurants/import", methods=["POST"])
+    @order_write
+    def og_import_restaurants(code):
+        return restaurants_import("order", order_group_or_404(code, write=True), OrderRestaurant)
+
+    @app.route("/og/<code>/restaurants/export", methods=["GET"])
+    def og_export_restaurants(code):
+        return restaurants_export(order_group_or_404(code), OrderRestaurant)
+
     @app.route("/og/<code>/restaurants/manage", methods=["GET"])
     def og_manage_restaurants(code):
-        group = OrderGroup.query.filter_by(code=code).first_or_404()
+        group = order_group_or_404(code)
         restaurants = OrderRestaurant.query.filter_by(group_id=group.id).order_by(OrderRestaurant.name.asc()).all()
         too_few = len(restaurants) <= MIN_RESTAURANTS
         return render_template("og_manage_restaurants.html", group=group, restaurants=restaurants, too_few=too_few)
 
     @app.route("/og/<code>/restaurants/<int:order_restaurant_id>/delete", methods=["POST"])
+    @order_write
     def og_delete_restaurant(code, order_restaurant_id):
-        group = OrderGroup.query.filter_by(code=code).first_or_404()
+        group = order_group_or_404(code, write=True)
         q = OrderRestaurant.query.filter_by(group_id=group.id)
         if q.count() <= MIN_RESTAURANTS:
             flash(f"至少需保留 {MIN_RESTAURANTS} 家餐廳，無法刪除。", "error")
@@ -262,8 +814,9 @@ def create_app():
 
     
     @app.route("/og/<code>/favorite/<int:order_restaurant_id>/toggle", methods=["POST"])
+    @order_write
     def toggle_favorite_order(code, order_restaurant_id):
-        group = OrderGroup.query.filter_by(code=code).first_or_404()
+        group = order_group_or_404(code, write=True)
         r = OrderRestaurant.query.filter_by(group_id=group.id, id=order_restaurant_id).first_or_404()
 
         link = OrderFavorite.query.filter_by(group_id=group.id, order_restaurant_id=r.id).first()
@@ -288,22 +841,31 @@ def create_app():
             return render_template("vote.html",
                 group=None, restaurants=[], votes={},
                 scope="vote", saved_nick=None,
-                comments_stream_url=None, comment_post_url=None
+                comments_stream_url=None, comments_events_url=None, comment_post_url=None
             )
 
-        cleanup_expired_vote_group(group)
-        group = get_vote_group(code)
-        if not group:
+        meta = group.meta
+        # 過期群組由 sweeper 刪除；這裡只讀，不在請求中刪資料
+        if is_expired(group):
             flash("此群組已過期並刪除。", "info")
             return redirect(url_for("vote"))
 
-        meta = VoteGroupMeta.query.filter_by(group_id=group.id).first()
-        restaurants = VoteRestaurant.query.filter_by(group_id=group.id).order_by(VoteRestaurant.name.asc()).all()
-        votes_map = {vr.vote_restaurant_id: vr.votes for vr in VoteResult.query.filter_by(group_id=group.id)}
-
         now_utc = datetime.now(timezone.utc)
         deadline_utc = to_aware_utc(meta.vote_deadline) if meta else None
         is_closed = bool(meta and deadline_utc and now_utc >= deadline_utc)
+        if tallies and is_closed:
+            tallies.flush(group.id)  # 截止後先把本 worker 的增量寫回
+
+        get_client_id()  # 同 order()：先發 cid 給限流使用
+        # 截止後（write-behind 時再多等兩個寫回週期，讓其他 worker 的增量也寫回）改用結果快照
+        freeze_at = deadline_utc + timedelta(milliseconds=2 * app.config["TALLY_WRITE_BEHIND_MS"]) if meta else None
+        if freeze_at and now_utc >= freeze_at:
+            return closed_vote_page(group)
+        page = load_vote_page(group.id)  # 餐廳與票數一句查詢
+        votes_map = dict(page.votes)
+        if tallies:
+            for rid, n in tallies.pending(group.id).items():
+                votes_map[rid] = votes_map.get(rid, 0) + n
 
         winner_ids = set()
         if is_closed and votes_map:
@@ -313,29 +875,78 @@ def create_app():
 
         return render_template(
             "vote.html",
-            group=group, restaurants=restaurants, votes=votes_map,
+            group=group, restaurants=page.restaurants, votes=votes_map,
             scope="vote",
             saved_nick=get_nick("vote", group.code),
             comments_stream_url=url_for("vg_comments_stream", code=group.code),
+            comments_events_url=events_url("vg_comments_events", group.code),
             comment_post_url=url_for("vg_post_comment", code=group.code),
             meta=meta, is_closed=is_closed, winner_ids=winner_ids
         )
 
     
+    def closed_vote_page(group: GroupRef):
+        """已截止：從快照渲染；瀏覽器每次以 ETag 重新驗證，沒變就回 304（頁面含暱稱，故為 private）。
+
+        不給 max-age：暱稱改了、重新部署換了靜態檔網址，或群組過期被刪除時，都要在下一次開啟時生效。
+        """
+        saved_nick = get_nick("vote", group.code)
+        page_key = f"{saved_nick or ''}|{' '.join(sorted(assets.manifest.values()))}"
+        etag = f"closed-{group.id}-{zlib.crc32(page_key.encode()):x}"
+        has_flash = bool(session.get("_flashes"))
+        if not has_flash and request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+        else:
+            snapshot = load_snapshot(group.id)
+            if snapshot is None:
+                use_primary()   # 快照一旦寫入就不再變，必須以主庫的票數計算
+                reconcile([group.id])   # 凍結前以 ledger 補正遺失的 write-behind 增量
+                snapshot = freeze_results(group.id)
+                db.session.commit()
+            resp = make_response(render_template(
+                "vote.html",
+                group=group, restaurants=snapshot.restaurants, votes=snapshot.votes,
+                scope="vote",
+                saved_nick=saved_nick,
+                comments_stream_url=url_for("vg_comments_stream", code=group.code),
+                comments_events_url=events_url("vg_comments_events", group.code),
+                comment_post_url=url_for("vg_post_comment", code=group.code),
+                meta=group.meta, is_closed=True, winner_ids=snapshot.winner_ids
+            ))
+            if has_flash:   # 這次帶著一次性的訊息，不能被快取
+                resp.headers["Cache-Control"] = "no-store"
+                return resp
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+
     # 聚餐投票：留言串流
     @app.route("/vg/<code>/comments/stream", methods=["GET"])
     def vg_comments_stream(code):
-        group = VoteGroup.query.filter_by(code=code).first_or_404()
-        comments = (VoteComment.query
-                    .filter_by(group_id=group.id)
-                    .order_by(VoteComment.created_at.asc())
-                    .limit(50).all())
-        return render_template("partials/comments_stream.html", comments=comments)
+        group_id, version = group_version("vote", code)
+        return comments_stream("vote", VoteComment, group_id, version)
+
+    # 聚餐投票：目前票數（JSON，供頁面輪詢更新票數；沒變動時回 304）
+    @app.route("/vg/<code>/tally", methods=["GET"])
+    def vg_tally(code):
+        group_id, version = group_version("vote", code)
+
+        def build():
+            return jsonify(votes={str(rid): v for rid, v in current_votes(group_id).items()})
+
+        return conditional(f"tally-{group_id}-{version}", build)
+
+    # 聚餐投票：留言即時推送（SSE）
+    @app.route("/vg/<code>/comments/events", methods=["GET"])
+    def vg_comments_events(code):
+        group = vote_group_or_404(code)
+        return comment_events(VoteComment, group.id, f"vote:{group.id}")
 
     # 聚餐投票：新增留言
     @app.route("/vg/<code>/comments", methods=["POST"])
+    @rate_limited("comment")
     def vg_post_comment(code):
-        group = VoteGroup.query.filter_by(code=code).first_or_404()
+        group = vote_group_or_404(code)
         nickname = (request.form.get("nickname") or "").strip()
         message = (request.form.get("message") or "").strip()
 
@@ -349,15 +960,17 @@ def create_app():
         
         message = message[:30]
         db.session.add(VoteComment(group_id=group.id, nickname=nickname, message=message))
+        comment_bus.publish(db.session, f"vote:{group.id}")
+        bump_version("vote", group.id)
+        trim_comments(VoteComment, group.id)
         db.session.commit()
-        trim_comments(VoteComment, group.id, keep=50)
         return redirect(url_for("vote", code=code))
 
 
     
     @app.route("/vg/<code>/restaurants/new", methods=["GET", "POST"])
     def vg_add_restaurant(code):
-        group = VoteGroup.query.filter_by(code=code).first_or_404()
+        group = vote_group_or_404(code)
 
         if request.method == "POST":
             name = (request.form.get("name") or "").strip()
@@ -376,7 +989,7 @@ def create_app():
 
             exists = VoteRestaurant.query.filter(
                 VoteRestaurant.group_id == group.id,
-                db.func.lower(VoteRestaurant.name) == name.lower()
+                VoteRestaurant.name_key == normalize_name(name)
             ).first()
             if exists:
                 flash("此餐廳已存在於本群組。", "warning")
@@ -389,92 +1002,198 @@ def create_app():
 
         return render_template("vg_add_restaurant.html", group=group)
 
+    @app.route("/vg/<code>/restaurants/import", methods=["POST"])
+    def vg_import_restaurants(code):
+        return restaurants_import("vote", vote_group_or_404(code), VoteRestaurant)
+
+    @app.route("/vg/<code>/restaurants/export", methods=["GET"])
+    def vg_export_restaurants(code):
+        return restaurants_export(vote_group_or_404(code), VoteRestaurant)
+
     @app.route("/vg/<code>/restaurants/manage", methods=["GET"])
     def vg_manage_restaurants(code):
-        group = VoteGroup.query.filter_by(code=code).first_or_404()
+        group = vote_group_or_404(code)
         restaurants = VoteRestaurant.query.filter_by(group_id=group.id).order_by(VoteRestaurant.name.asc()).all()
         too_few = len(restaurants) <= MIN_RESTAURANTS
         return render_template("vg_manage_restaurants.html", group=group, restaurants=restaurants, too_few=too_few)
 
     @app.route("/vg/<code>/restaurants/<int:vote_restaurant_id>/delete", methods=["POST"])
     def vg_delete_restaurant(code, vote_restaurant_id):
-        group = VoteGroup.query.filter_by(code=code).first_or_404()
+        group = vote_group_or_404(code)
         q = VoteRestaurant.query.filter_by(group_id=group.id)
         if q.count() <= MIN_RESTAURANTS:
             flash(f"至少需保留 {MIN_RESTAURANTS} 家餐廳，無法刪除。", "error")
             return redirect(url_for("vg_manage_restaurants", code=group.code))
 
         r = q.filter_by(id=vote_restaurant_id).first_or_404()
-        # 同步清掉票數
+        # 同步清掉票數與這家的選票（投過的人拿回那一票）
         VoteResult.query.filter_by(group_id=group.id, vote_restaurant_id=r.id).delete()
+        VoteLedger.query.filter_by(group_id=group.id, vote_restaurant_id=r.id).delete()
         db.session.delete(r)
+        bump_version("vote", group.id)
+        if tallies:
+            tallies.discard(group.id, r.id)
         db.session.commit()
         flash("已刪除餐廳。", "info")
         return redirect(url_for("vg_manage_restaurants", code=group.code))
 
     @app.route("/vg/<code>/vote/<int:vote_restaurant_id>", methods=["POST"])
+    @rate_limited("vote")
     def vote_restaurant(code, vote_restaurant_id):
-        group = VoteGroup.query.filter_by(code=code).first_or_404()
-        r = VoteRestaurant.query.filter_by(group_id=group.id, id=vote_restaurant_id).first_or_404()
-        meta = VoteGroupMeta.query.filter_by(group_id=group.id).first()
+        group = vote_group_or_404(code)
 
-        # 截止檢查（使用你前面寫好的 to_aware_utc）
-        deadline_utc = to_aware_utc(meta.vote_deadline) if meta else None
-        if deadline_utc and datetime.now(timezone.utc) >= deadline_utc:
-            flash("投票已截止。", "info")
-            return redirect(url_for("vote", code=code))
-
-        # 取得匿名身份（每個瀏覽器一組）
+        # 取得匿名身份（每個瀏覽器一組）；截止、同餐廳一次、每人票數上限都由 cast_vote 在資料庫內檢查
         client_id = get_client_id()
+        nickname = (get_nick("vote", code) or "訪客")[:10]
+        result = votes.cast_vote(group.id, vote_restaurant_id, client_id, nickname,
+                                 update_tally=tallies is None)
 
-        # 同餐廳僅能一次（以 client_id 判定）
-        existed = VoteToken.query.filter_by(group_id=group.id, client_id=client_id,
-                                            vote_restaurant_id=r.id).first()
-        if existed:
-            flash("你已經投過這家餐廳囉！", "warning")
-            return redirect(url_for("vote", code=code))
+        if result == votes.NOT_FOUND:
+            abort(404)
+        if result == votes.CAST:
+            bump_version("vote", group.id)
+            db.session.commit()
+            if tallies:
+                tallies.add(group.id, vote_restaurant_id)
+            flash(vote_message(result, group), "success")
+        else:
+            flash(vote_message(result, group), "info" if result == votes.CLOSED else "warning")
+        return redirect(url_for("vote", code=code))
+    
 
-        # 每人（每 client_id）投票上限
-        limit = meta.votes_per_person if meta else 1
-        used = VoteToken.query.filter_by(group_id=group.id, client_id=client_id).count()
-        if used >= limit:
-            flash(f"每人限投 {limit} 票，你已用完。", "warning")
-            return redirect(url_for("vote", code=code))
+    # ===== JSON API（/api/v1）：一個請求、一個交易完成多筆操作，頁面用來就地更新 =====
+    API_BATCH_MAX = 20
 
-        # 記錄 Token（身份限制）
-        db.session.add(VoteToken(group_id=group.id, client_id=client_id, vote_restaurant_id=r.id))
+    def api_error(status: int, error: str, message: str, **extra):
+        return jsonify(ok=False, error=error, message=message, **extra), status
 
-        # 記錄 Ballot（提供顯示用途；暱稱可選）
-        nickname = (get_nick("vote", code) or "訪客")[:10]
-        db.session.add(VoteBallot(group_id=group.id, nickname=nickname, vote_restaurant_id=r.id))
+    def api_ids(body: dict, field: str) -> list[int] | None:
+        """取出 body[field] 的 id 清單（去重、保留順序）；格式不對回 None。"""
+        ids = body.get(field, [])
+        if not isinstance(ids, list) or len(ids) > API_BATCH_MAX \
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return None
+        return list(dict.fromkeys(ids))
 
-        # 統計 +1
-        vr = VoteResult.query.filter_by(group_id=group.id, vote_restaurant_id=r.id).first()
-        if not vr:
-            vr = VoteResult(group_id=group.id, vote_restaurant_id=r.id, votes=0)
-            db.session.add(vr)
-        vr.votes += 1
+    def api_body() -> dict:
+        body = request.get_json(silent=True)
+        return body if isinstance(body, dict) else {}
+
+    @app.route("/api/v1/vg/<code>/votes", methods=["POST"])
+    @rate_limited("vote")
+    def api_cast_votes(code):
+        """{"restaurant_ids": [...]}：整批一個交易，任一票不成立則全部不算。"""
+        group = get_vote_group(code)
+        if not group or is_expired(group):
+            return api_error(404, "group_not_found", "找不到群組。")
+        ids = api_ids(api_body(), "restaurant_ids")
+        if not ids:
+            return api_error(400, "bad_request", f"restaurant_ids 需為 1~{API_BATCH_MAX} 個餐廳 id。")
 
+        client_id = get_client_id()
+        nickname = (get_nick("vote", code) or "訪客")[:10]
+        # 整批超過剩餘票數就先擋下（逐票失敗時 rollback 後已看不出是整批超額）
+        used = votes.used_votes(group.id, client_id)
+        limit = group.meta.votes_per_person if group.meta else 1
+        if used + len(ids) > limit:
+            return api_error(409, votes.QUOTA_USED, f"每人限投 {limit} 票，你還能投 {max(0, limit - used)} 票。",
+                             remaining=max(0, limit - used))
+        for rid in ids:
+            result = votes.cast_vote(group.id, rid, client_id, nickname, update_tally=tallies is None)
+            if result != votes.CAST:   # cast_vote 已 rollback，前面幾票一併取消
+                return api_error(404 if result == votes.NOT_FOUND else 409, result,
+                                 vote_message(result, group), restaurant_id=rid)
+        bump_version("vote", group.id)
         db.session.commit()
-        flash("已投票！", "success")
-        return redirect(url_for("vote", code=code))
-    
+        if tallies:
+            for rid in ids:
+                tallies.add(group.id, rid)
+        return jsonify(ok=True, cast=ids, message=vote_message(votes.CAST, group),
+                       votes={str(rid): v for rid, v in current_votes(group.id).items()})
+
+    @app.route("/api/v1/og/<code>/favorites", methods=["POST"])
+    @order_write
+    def api_update_favorites(code):
+        """{"add": [...], "remove": [...]}：回傳更新後的常訂餐廳 id。"""
+        group = get_order_group(code)
+        if not group:
+            return api_error(404, "group_not_found", "找不到群組。")
+        guard_order_group(group.id)
+        body = api_body()
+        add, remove = api_ids(body, "add"), api_ids(body, "remove")
+        if add is None or remove is None:
+            return api_error(400, "bad_request", f"add / remove 需為最多 {API_BATCH_MAX} 個餐廳 id。")
+
+        if add:
+            db.session.execute(dialect_insert(OrderFavorite).from_select(
+                ["group_id", "order_restaurant_id"],
+                db.select(db.literal(group.id), OrderRestaurant.id)
+                .where(OrderRestaurant.group_id == group.id, OrderRestaurant.id.in_(add)),
+            ).on_conflict_do_nothing())
+        if remove:
+            db.session.execute(db.delete(OrderFavorite).where(OrderFavorite.group_id == group.id,
+                                                              OrderFavorite.order_restaurant_id.in_(remove)))
+        db.session.commit()
+        favorites = db.session.scalars(db.select(OrderFavorite.order_restaurant_id)
+                                       .where(OrderFavorite.group_id == group.id)).all()
+        return jsonify(ok=True, favorites=sorted(favorites))
+
+    def api_delete_restaurants(scope: str, group, model):
+        """{"ids": [...]}：整批刪除；刪完少於 MIN_RESTAURANTS 家則一家都不刪。"""
+        ids = api_ids(api_body(), "ids")
+        if not ids:
+            return api_error(400, "bad_request", f"ids 需為 1~{API_BATCH_MAX} 個餐廳 id。")
+        existing = db.session.scalars(db.select(model.id).where(model.group_id == group.id)).all()
+        doomed = [rid for rid in ids if rid in set(existing)]
+        if len(existing) - len(doomed) < MIN_RESTAURANTS:
+            return api_error(409, "too_few", f"至少需保留 {MIN_RESTAURANTS} 家餐廳，無法刪除。")
+
+        if doomed:
+            if scope == "order":   # 同步清掉常訂關聯
+                db.session.execute(db.delete(OrderFavorite).where(OrderFavorite.group_id == group.id,
+                                                                  OrderFavorite.order_restaurant_id.in_(doomed)))
+            else:                  # 同步清掉票數與選票
+                for child in (VoteResult, VoteLedger):
+                    db.session.execute(db.delete(child).where(child.group_id == group.id,
+                                                              child.vote_restaurant_id.in_(doomed)))
+                bump_version("vote", group.id)
+            db.session.execute(db.delete(model).where(model.group_id == group.id, model.id.in_(doomed)))
+            db.session.commit()
+            if tallies and scope == "vote":
+                for rid in doomed:
+                    tallies.discard(group.id, rid)
+        return jsonify(ok=True, deleted=doomed, remaining=len(existing) - len(doomed))
+
+    @app.route("/api/v1/og/<code>/restaurants/delete", methods=["POST"])
+    @order_write
+    def api_og_delete_restaurants(code):
+        group = get_order_group(code)
+        if not group:
+            return api_error(404, "group_not_found", "找不到群組。")
+        guard_order_group(group.id)
+        return api_delete_restaurants("order", group, OrderRestaurant)
+
+    @app.route("/api/v1/vg/<code>/restaurants/delete", methods=["POST"])
+    def api_vg_delete_restaurants(code):
+        group = get_vote_group(code)
+        if not group or is_expired(group):
+            return api_error(404, "group_not_found", "找不到群組。")
+        return api_delete_restaurants("vote", group, VoteRestaurant)
 
     @app.route("/group/new", methods=["GET", "POST"])
     def group_new():
         scope = request.args.get("scope", "vote")
         # 若沒帶 next，預設與 scope 相同（'order' → order、'vote' → vote）
         next_page = request.args.get("next") or scope
+        # 從既有群組複製餐廳清單（'order:CODE' 或 'vote:CODE'），只用於新增聚餐投票群組
+        copy_from = request.form.get("copy_from") or request.args.get("copy_from") or ""
 
         if request.method == "POST":
             name = (request.form.get("name") or "").strip()
 
             if scope == "order":
                 # 建立「訂餐揪團」群組
-                code = _gen_code(6)
-                og = OrderGroup(code=code, name=name)
-                db.session.add(og)
-                db.session.commit()
+                og = create_group(OrderGroup, name)
                 flash("已建立訂餐群組！", "success")
                 return redirect(url_for(next_page, code=og.code))  # ← 立刻 return
 
@@ -491,30 +1210,37 @@ def create_app():
                 # 驗證（整點/時間關係）
                 if not event_at_utc or not deadline_utc:
                     flash("請填寫『聚餐日期時間』與『投票截止時間』。", "error")
-                    return redirect(url_for("group_new", scope="vote", next_page=next_page))
+                    return redirect(url_for("group_new", scope="vote", next_page=next_page, copy_from=copy_from or None))
                 if event_at_utc.minute != 0 or deadline_utc.minute != 0:
                     flash("時間必須為整點（分鐘為 00）。", "error")
-                    return redirect(url_for("group_new", scope="vote", next_page=next_page))
+                    return redirect(url_for("group_new", scope="vote", next_page=next_page, copy_from=copy_from or None))
                 if not (deadline_utc < event_at_utc):
                     flash("聚餐時間必須晚於投票截止時間。", "error")
-                    return redirect(url_for("group_new", scope="vote", next_page=next_page))
+                    return redirect(url_for("group_new", scope="vote", next_page=next_page, copy_from=copy_from or None))
                 if event_at_utc <= now_utc:
                     flash("聚餐時間必須晚於目前時間。", "error")
-                    return redirect(url_for("group_new", scope="vote", next_page=next_page))
+                    return redirect(url_for("group_new", scope="vote", next_page=next_page, copy_from=copy_from or None))
                 if votes_per_person not in (1, 2, 3):
                     votes_per_person = 1
 
-                code = _gen_code(6)
-                vg = VoteGroup(code=code, name=name)
-                db.session.add(vg)
-                db.session.flush()
-                db.session.add(VoteGroupMeta(
-                    group_id=vg.id,
-                    event_at=event_at_utc,
-                    vote_deadline=deadline_utc,
-                    votes_per_person=votes_per_person
-                ))
-                db.session.commit()
+                # 先找來源群組再建立新群組：查詢來源會切換分片，新群組建立後就留在自己的分片
+                source_scope, _, source_code = copy_from.partition(":")
+                source = None
+                if source_code:
+                    source = get_order_group(source_code) if source_scope == "order" else get_vote_group(source_code)
+
+                def populate(vg):
+                    db.session.add(VoteGroupMeta(
+                        group_id=vg.id,
+                        event_at=event_at_utc,
+                        vote_deadline=deadline_utc,
+                        votes_per_person=votes_per_person
+                    ))
+                    if source:
+                        copy_restaurants(OrderRestaurant if source_scope == "order" else VoteRestaurant,
+                                         source.id, vg.id, source_shard=source.shard)
+
+                vg = create_group(VoteGroup, name, populate)
                 flash("已建立聚餐投票群組！", "success")
                 return redirect(url_for(next_page, code=vg.code))  # ← 立刻 return
 
@@ -524,7 +1250,7 @@ def create_app():
 
         # GET：顯示不同表單
         if scope == "vote":
-            return render_template("group_new_vote.html", scope="vote", next_page=next_page)
+            return render_template("group_new_vote.html", scope="vote", next_page=next_page, copy_from=copy_from)
         else:
             return render_template("group_new_order.html", scope="order", next_page=next_page)
         
@@ -534,11 +1260,8 @@ def create_app():
         scope = request.args.get("scope", "vote")
         next_page = request.args.get("next_page", "vote")
         if request.method == "POST":
-            code = (request.form.get("code") or "").strip().upper()
-            if scope == "order":
-                g = OrderGroup.query.filter(db.func.upper(OrderGroup.code) == code).first()
-            else:
-                g = VoteGroup.query.filter(db.func.upper(VoteGroup.code) == code).first()
+            code = request.form.get("code")
+            g = get_order_group(code) if scope == "order" else get_vote_group(code)
 
             if not g:
                 flash("找不到該群組代碼。", "error")
@@ -551,6 +1274,14 @@ def create_app():
     @app.route("/healthz") # for 佈署用
     def healthz():
         return "ok", 200
+
+    @app.route("/metrics") # Prometheus（本 worker 的統計）
+    def metrics_endpoint():
+        return metrics.response()
+
+    @app.route("/healthz/cache") # 群組快取命中率（本 worker）
+    def healthz_cache():
+        return jsonify(groups.stats())
     
     return app
 
@@ -0,0 +1,111 @@
+"""靜態檔指紋化與預先壓縮。
+
+build_assets() 把 static/ 底下的檔案依內容雜湊複製成 static/dist/<名稱>.<雜湊>.<副檔名>，
+另存一份 .gz，並寫出 manifest.json（原檔名 → 指紋檔名）。
+- 模板照舊寫 url_for('static', filename='style.css')，url_defaults 會自動換成指紋檔名
+- 指紋檔內容永不改變：回應 Cache-Control: public, max-age=一年, immutable，瀏覽器不再重新驗證
+- 用戶端接受 gzip 時直接送預先壓縮的 .gz，不在請求中壓縮
+`flask assets build` 供部署流程使用；ASSET_AUTOBUILD 開啟時（預設）啟動時若原始檔較新也會自動重建。
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+
+from flask import request, send_from_directory
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+ONE_YEAR = 365 * 24 * 3600
+
+
+def _sources(static_dir: str):
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [d for d in dirs if d != DIST]
+        for name in files:
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def _write_atomic(path: str, data: bytes):
+    """先寫暫存檔再 rename：多個 worker 同時重建也不會讀到寫一半的檔案。"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(static_dir: str) -> dict[str, dict]:
+    """產生指紋檔、.gz 與 manifest.json；回傳 {原檔名: {"path", "bytes", "gzip_bytes"}}。"""
+    dist_dir = os.path.join(static_dir, DIST)
+    manifest, report = {}, {}
+    for name, path in _sources(static_dir):
+        with open(path, "rb") as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        target = os.path.join(dist_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        compressed = gzip.compress(data, 9, mtime=0)
+        if not os.path.exists(target):
+            _write_atomic(target, data)
+        if len(compressed) < len(data) and not os.path.exists(target + ".gz"):
+            _write_atomic(target + ".gz", compressed)
+        manifest[name] = f"{DIST}/{hashed}"
+        report[name] = {"path": manifest[name], "bytes": len(data), "gzip_bytes": min(len(compressed), len(data))}
+    os.makedirs(dist_dir, exist_ok=True)
+    _write_atomic(os.path.join(dist_dir, MANIFEST),
+                  json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode())
+    return report
+
+
+def _stale(static_dir: str) -> bool:
+    manifest = os.path.join(static_dir, DIST, MANIFEST)
+    if not os.path.exists(manifest):
+        return True
+    built = os.path.getmtime(manifest)
+    return any(os.path.getmtime(path) > built for _, path in _sources(static_dir))
+
+
+class Assets:
+    def __init__(self):
+        self.manifest: dict[str, str] = {}
+        self.static_dir: str | None = None
+
+    def init_app(self, app, autobuild: bool = True):
+        app.extensions["assets"] = self
+        self.static_dir = app.static_folder
+        if autobuild and _stale(self.static_dir):
+            build_assets(self.static_dir)
+        self.load()
+        app.url_defaults(self._hashed_url)
+        app.view_functions["static"] = self.serve
+
+    def load(self):
+        try:
+            with open(os.path.join(self.static_dir, DIST, MANIFEST), encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self._hashed = set(self.manifest.values())
+
+    def _hashed_url(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = self.manifest[values["filename"]]
+
+    def serve(self, filename: str):
+        if filename not in self._hashed:
+            return send_from_directory(self.static_dir, filename)   # 未指紋化：沿用 Flask 預設（每次重新驗證）
+        mimetype = mimetypes.guess_type(filename)[0]
+        gz = os.path.join(self.static_dir, filename + ".gz")
+        if request.accept_encodings["gzip"] and os.path.exists(gz):
+            resp = send_from_directory(self.static_dir, filename + ".gz", mimetype=mimetype)
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            resp = send_from_directory(self.static_dir, filename, mimetype=mimetype)
+        resp.vary.add("Accept-Encoding")
+        resp.headers["Cache-Control"] = f"public, max-age={ONE_YEAR}, immutable"
+        return resp
@@ -0,0 +1,87 @@
+"""餐廳目錄前綴搜尋的延遲：在暫存資料庫塞 N 筆目錄，量測 /restaurants/search 背後的查詢。
+
+    python bench/catalog_search.py --rows 1000000
+    python bench/catalog_search.py --rows 1000000 --database-url postgresql://localhost/meal_bench
+
+分別量測「只查資料庫」（warm_size=0）與「前綴樹 + 資料庫補足」兩種情況，
+前綴長度 1~3 個字元隨機，輸出 p50/p95/p99（毫秒）。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYLLABLES = ["麥", "當", "勞", "摩", "斯", "八", "方", "雲", "集", "鍋", "貼", "拉", "麵", "牛", "肉",
+             "便", "當", "咖", "哩", "飯", "壽", "司", "早", "午", "餐", "小", "吃", "店", "館", "屋"]
+LATIN = ["burger", "pizza", "sushi", "curry", "noodle", "cafe", "deli", "grill", "taco", "pho"]
+
+
+def fake_name(rnd: random.Random, i: int) -> str:
+    if rnd.random() < 0.3:
+        return f"{rnd.choice(LATIN)} {rnd.choice(LATIN)} {i}"
+    return "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 5))) + str(i)
+
+
+def seed(rows: int, rnd: random.Random):
+    from models import db, normalize_name, RestaurantCatalog
+
+    batch = []
+    for i in range(rows):
+        name = fake_name(rnd, i)
+        batch.append({"name": name, "name_key": normalize_name(name), "phone": "",
+                      "uses": int(rnd.paretovariate(1.2))})
+        if len(batch) == 10000:
+            db.session.execute(RestaurantCatalog.__table__.insert(), batch)
+            batch.clear()
+    if batch:
+        db.session.execute(RestaurantCatalog.__table__.insert(), batch)
+    db.session.commit()
+
+
+def measure(search, queries: list[str]) -> dict:
+    for q in queries[:50]:   # 暖機
+        search.search(q)
+    ms = []
+    for q in queries:
+        t0 = time.perf_counter()
+        search.search(q)
+        ms.append((time.perf_counter() - t0) * 1000)
+    ms.sort()
+    p = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 3)
+    return {"p50": p(0.5), "p95": p(0.95), "p99": p(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="預設為暫存 SQLite 檔")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--warm-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/catalog.db"
+    from app import create_app
+    from catalog import CatalogSearch
+
+    rnd = random.Random(42)
+    app = create_app()
+    with app.app_context():
+        t0 = time.perf_counter()
+        seed(args.rows, rnd)
+        print(f"seeded {args.rows} rows in {time.perf_counter() - t0:.1f}s")
+        alphabet = SYLLABLES + [w[:1] for w in LATIN]
+        queries = []
+        for _ in range(args.queries):
+            word = rnd.choice(LATIN) if rnd.random() < 0.3 else "".join(rnd.choice(SYLLABLES) for _ in range(3))
+            queries.append(word[:rnd.randint(1, 3)] if rnd.random() < 0.9 else rnd.choice(alphabet))
+        for label, warm in (("db only", 0), (f"trie({args.warm_size}) + db", args.warm_size)):
+            r = measure(CatalogSearch(warm_size=warm, ttl=3600), queries)
+            print(f"{label:>20}: p50 {r['p50']} ms  p95 {r['p95']} ms  p99 {r['p99']} ms")
+
+
+if __name__ == "__main__":
+    main()
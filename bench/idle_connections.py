@@ -0,0 +1,122 @@
+"""長連線壓力：比較 gunicorn 各 WORKER_PROFILE 能同時掛住多少條 SSE 連線。
+
+    python bench/idle_connections.py --idle 500 --workers 2
+    python bench/idle_connections.py --profiles gevent --idle 2000
+
+對每個 profile 以子行程啟動 gunicorn（讀取 gunicorn.conf.py，暫存 SQLite），
+先開 --idle 條留言 SSE 連線並保持不讀，統計幾條在期限內拿到 200；
+再量測同時間一般頁面（/order）的延遲與失敗數。
+"""
+import argparse
+import os
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_ready(base: str, timeout: float = 20):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            urllib.request.urlopen(base + "/healthz", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def create_group(base: str) -> str:
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+    try:
+        opener.open(base + "/group/new?scope=order", data=urllib.parse.urlencode({"name": "idle"}).encode())
+    except urllib.error.HTTPError as e:
+        return e.headers["Location"].split("code=")[1]
+    raise RuntimeError("group_new did not redirect")
+
+
+def open_streams(port: int, code: str, count: int, wait: float) -> tuple[list[socket.socket], int]:
+    """開 count 條 SSE 連線（只送出請求、不讀內容），回傳 (sockets, wait 秒內拿到 200 的條數)。"""
+    socks = []
+    request = (f"GET /og/{code}/comments/events HTTP/1.1\r\nHost: localhost\r\n"
+               "Accept: text/event-stream\r\n\r\n").encode()
+    for _ in range(count):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(request)
+        socks.append(s)
+    pending, established = set(socks), 0
+    end = time.monotonic() + wait
+    while pending and time.monotonic() < end:
+        ready, _, _ = select.select(list(pending), [], [], max(0, end - time.monotonic()))
+        for s in ready:
+            pending.discard(s)
+            if s.recv(64).startswith(b"HTTP/1.1 200"):
+                established += 1
+    return socks, established
+
+
+def page_latency(base: str, code: str, n: int, timeout: float) -> tuple[list[float], int]:
+    latencies, failures = [], 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            urllib.request.urlopen(f"{base}/order?code={code}", timeout=timeout).read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except OSError:
+            failures += 1
+    return sorted(latencies), failures
+
+
+def run_profile(profile: str, args) -> dict:
+    port = args.port
+    env = dict(os.environ, WORKER_PROFILE=profile, PORT=str(port), WEB_CONCURRENCY=str(args.workers),
+               DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/idle.db", SSE_STREAM_SECONDS="120",
+               SSE_ENABLED="1")   # sync 也強制開啟，才量得到長連線佔住 worker 的代價
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:create_app()"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base)
+        code = create_group(base)
+        socks, established = open_streams(port, code, args.idle, args.wait)
+        latencies, failures = page_latency(base, code, args.requests, args.timeout)
+        for s in socks:
+            s.close()
+    finally:
+        proc.terminate()
+        proc.wait()
+    p = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1) if latencies else None
+    return {"profile": profile, "idle_requested": args.idle, "idle_established": established,
+            "page_ok": len(latencies), "page_failed": failures, "page_p50_ms": p(0.5), "page_p95_ms": p(0.95)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="sync,gthread,gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--idle", type=int, default=500, help="同時掛住的 SSE 連線數")
+    parser.add_argument("--wait", type=float, default=10, help="等待 SSE 連線建立的秒數")
+    parser.add_argument("--requests", type=int, default=20, help="量測延遲的一般頁面請求數")
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for profile in args.profiles.split(","):
+        r = run_profile(profile, args)
+        print(f"{r['profile']:>8}: SSE {r['idle_established']}/{r['idle_requested']} established · "
+              f"/order ok {r['page_ok']} failed {r['page_failed']} · p50 {r['page_p50_ms']} ms p95 {r['page_p95_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""午餐尖峰壓力測試：在本機起一個 app，模擬 N 個使用者同時操作。
+
+    python bench/loadtest.py --clients 50 --duration 30 --out results/sqlite.json
+    python bench/loadtest.py --database-url postgresql://localhost/meal_bench --out results/pg.json
+    python bench/loadtest.py --out results/new.json --baseline results/sqlite.json
+    python bench/loadtest.py --target http://127.0.0.1:8000     # 對已啟動的 gunicorn 施壓
+    python bench/loadtest.py --gzip --out results/gzip.json      # 帶 Accept-Encoding: gzip，bytes 為實際傳輸量
+
+不需要外部服務：以 werkzeug 多執行緒伺服器在背景執行 create_app()（預設用暫存 SQLite 檔），
+透過 group_new 建立群組，之後每個模擬使用者（各自的 session cookie）依 --mix 比例
+隨機瀏覽 /order、/vote、輪詢留言、發留言與投票。
+結果為各路由的 p50/p95/p99 延遲（毫秒）與每秒請求數，可存成 JSON 與先前的結果比較。
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = "order_page=20,vote_page=20,poll_comments=45,post_comment=5,cast_vote=10"
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """表單 POST 後的 302 不跟隨：只量測該次請求本身。"""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    def __init__(self, base: str):
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect)
+
+    def request(self, path: str, data: dict | None = None, headers: dict | None = None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base + path, data=body, headers=headers or {})
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                return resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:   # 302 / 304 / 4xx 也會走到這裡
+            return e.code, e.headers, e.read()
+
+
+def start_server(db_url: str, port: int):
+    os.environ["DATABASE_URL"] = db_url
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server("127.0.0.1", port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed(base: str, groups: int, restaurants: int) -> list[tuple[str, str, list[int]]]:
+    """透過 group_new 建立訂餐／投票群組各 groups 個，每組 restaurants 家餐廳；回傳 (scope, code, 餐廳 id)。"""
+    admin = Client(base)
+    seeded = []
+    for scope in ("order", "vote"):
+        for _ in range(groups):
+            form = {"name": "bench"}
+            if scope == "vote":
+                form.update(event_at="2099-01-01T12:00", vote_deadline="2099-01-01T10:00", votes_per_person="3")
+            _, headers, _ = admin.request(f"/group/new?scope={scope}", form)
+            code = headers["Location"].split("code=")[1]
+            prefix = "og" if scope == "order" else "vg"
+            for i in range(restaurants):
+                admin.request(f"/{prefix}/{code}/restaurants/new", {"name": f"餐廳{i}", "phone": "02-1234"})
+            _, _, page = admin.request(f"/{scope}?code={code}")
+            ids = sorted({int(m) for m in re.findall(rf"/{prefix}/{code}/(?:vote|favorite)/(\d+)", page.decode())})
+            seeded.append((scope, code, ids))
+    return seeded
+
+
+def percentile(sorted_ms: list[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = min(len(sorted_ms) - 1, max(0, round(p / 100 * len(sorted_ms)) - 1))
+    return round(sorted_ms[k], 2)
+
+
+def run(args) -> dict:
+    if args.target:
+        server, base, db_url = None, args.target.rstrip("/"), args.database_url or "external"
+    else:
+        db_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/loadtest.db"
+        server = start_server(db_url, args.port)
+        base = f"http://127.0.0.1:{server.server_port}"
+    seeded = seed(base, args.groups, args.restaurants)
+    order_codes = [c for s, c, _ in seeded if s == "order"]
+    vote_codes = [c for s, c, _ in seeded if s == "vote"]
+    restaurant_ids = {c: ids for _, c, ids in seeded}
+
+    mix = {k: int(v) for k, v in (item.split("=") for item in args.mix.split(","))}
+    actions, weights = zip(*mix.items())
+    samples = defaultdict(list)          # route → 延遲（毫秒）
+    statuses = defaultdict(lambda: defaultdict(int))
+    bytes_in = defaultdict(int)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def simulate(seed_value: int):
+        rnd = random.Random(seed_value)
+        client = Client(base)
+        etags = {}   # 像瀏覽器一樣記住輪詢回應的 ETag
+        while time.monotonic() < stop_at:
+            action = rnd.choices(actions, weights)[0]
+            if action == "order_page":
+                route, path, data = "GET /order", f"/order?code={rnd.choice(order_codes)}", None
+            elif action == "vote_page":
+                route, path, data = "GET /vote", f"/vote?code={rnd.choice(vote_codes)}", None
+            elif action == "poll_comments":
+                scope = rnd.choice(("og", "vg"))
+                code = rnd.choice(order_codes if scope == "og" else vote_codes)
+                route, path, data = f"GET /{scope}/comments/stream", f"/{scope}/{code}/comments/stream", None
+            elif action == "post_comment":
+                scope = rnd.choice(("og", "vg"))
+                code = rnd.choice(order_codes if scope == "og" else vote_codes)
+                route, path = f"POST /{scope}/comments", f"/{scope}/{code}/comments"
+                data = {"nickname": f"u{seed_value}", "message": "午餐吃什麼？"}
+            else:
+                route = "POST /vg/vote"
+                code = rnd.choice(vote_codes)
+                path, data = f"/vg/{code}/vote/{rnd.choice(restaurant_ids[code])}", {}
+            headers = {"If-None-Match": etags[path]} if path in etags else {}
+            if args.gzip:
+                headers["Accept-Encoding"] = "gzip"
+            t0 = time.perf_counter()
+            status, resp_headers, body = client.request(path, data, headers)
+            elapsed = (time.perf_counter() - t0) * 1000
+            if action == "poll_comments" and resp_headers.get("ETag"):
+                etags[path] = resp_headers["ETag"]
+            with lock:
+                samples[route].append(elapsed)
+                statuses[route][status] += 1
+                bytes_in[route] += len(body)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=simulate, args=(i,)) for i in range(args.clients)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - started
+    if server:
+        server.shutdown()
+
+    routes = {}
+    for route, ms in sorted(samples.items()):
+        ms.sort()
+        routes[route] = {
+            "requests": len(ms),
+            "rps": round(len(ms) / wall, 1),
+            "p50_ms": percentile(ms, 50),
+            "p95_ms": percentile(ms, 95),
+            "p99_ms": percentile(ms, 99),
+            "avg_bytes": round(bytes_in[route] / len(ms)),
+            "status": dict(statuses[route]),
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {
+        "database": db_url.split(":")[0],
+        "clients": args.clients,
+        "gzip": args.gzip,
+        "duration_s": round(wall, 2),
+        "mix": mix,
+        "total_rps": round(total / wall, 1),
+        "routes": routes,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """p95 變慢或吞吐量下降超過 tolerance（比例）的路由列為退步。"""
+    regressions = []
+    for route, now in result["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']} → {now['p95_ms']} ms")
+        if before["rps"] and now["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: rps {before['rps']} → {now['rps']}")
+    return regressions
+
+
+def print_table(result: dict):
+    print(f"{result['database']} · {result['clients']} clients{' · gzip' if result.get('gzip') else ''} · "
+          f"{result['duration_s']}s · "
+          f"{result['total_rps']} req/s total")
+    print(f"{'route':<28}{'reqs':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'bytes':>8}")
+    for route, r in result["routes"].items():
+        print(f"{route:<28}{r['requests']:>7}{r['rps']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['avg_bytes']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="預設為暫存 SQLite 檔")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20, help="秒")
+    parser.add_argument("--groups", type=int, default=10, help="訂餐／投票群組各幾個")
+    parser.add_argument("--restaurants", type=int, default=6)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"各動作權重（預設 {DEFAULT_MIX}）")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--target", help="改為對既有伺服器（例如 gunicorn）施壓，不在本行程啟動 app")
+    parser.add_argument("--gzip", action="store_true", help="請求帶 Accept-Encoding: gzip（urllib 不解壓，bytes 即傳輸量）")
+    parser.add_argument("--out", help="結果存成 JSON")
+    parser.add_argument("--baseline", help="與先前的 JSON 結果比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="退步門檻（比例）")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_table(result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
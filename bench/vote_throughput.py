@@ -0,0 +1,99 @@
+"""投票寫入吞吐量：直接更新 VoteResult vs. write-behind 緩衝。
+
+    python bench/vote_throughput.py --voters 600 --threads 16
+    python bench/vote_throughput.py --database-url postgresql://localhost/meal_bench
+    python bench/vote_throughput.py --groups 8 --shards 4     # 票分散在 8 個群組、4 個 SQLite 分片
+
+每位投票者（各自的 session / client_id）對同一群組投滿 3 票，
+模擬截止前大家擠在同幾家餐廳上的情境；每種模式各建一個新的資料庫（SQLite）
+或清空後重跑（其他資料庫）。
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(mode: str, db_url: str, voters: int, threads: int, restaurants: int, groups: int = 1) -> dict:
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["TALLY_WRITE_BEHIND_MS"] = "50" if mode == "write-behind" else "0"
+    from app import create_app
+    from models import db, VoteResult, VoteLedger
+    from sharding import each_shard
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    admin = app.test_client()
+    targets = []   # (代碼, 前三家餐廳 id)
+    for _ in range(groups):
+        resp = admin.post("/group/new?scope=vote", data={
+            "event_at": "2099-01-01T12:00", "vote_deadline": "2099-01-01T10:00", "votes_per_person": "3"})
+        code = resp.headers["Location"].split("code=")[1]
+        for i in range(restaurants):
+            admin.post(f"/vg/{code}/restaurants/new", data={"name": f"R{i}"})
+        page = admin.get(f"/vote?code={code}").get_data(as_text=True)
+        targets.append((code, sorted({int(m) for m in re.findall(rf"/vg/{code}/vote/(\d+)", page)})[:3]))
+
+    queue = list(range(voters))
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if not queue:
+                    return
+                voter = queue.pop()
+            with client.session_transaction() as s:
+                s["cid"] = f"voter-{voter}"
+            code, rids = targets[voter % groups]
+            for rid in rids:   # 大家都投前三家：同幾列 VoteResult 上的熱點
+                client.post(f"/vg/{code}/vote/{rid}")
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    tallies = app.extensions.get("tally_buffer")
+    with app.app_context():
+        if tallies:
+            tallies.flush()
+        tokens = counted = 0
+        for _ in each_shard():
+            tokens += VoteLedger.query.count()
+            counted += sum(vr.votes for vr in VoteResult.query)
+    return {"mode": mode, "votes": tokens, "counted": counted,
+            "seconds": round(elapsed, 3), "votes_per_sec": round(tokens / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="預設每種模式各用一個暫存 SQLite 檔")
+    parser.add_argument("--voters", type=int, default=600)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--restaurants", type=int, default=5)
+    parser.add_argument("--groups", type=int, default=1, help="票平均分散到幾個群組")
+    parser.add_argument("--shards", type=int, default=1, help="SQLITE_SHARDS（只用於 SQLite）")
+    args = parser.parse_args()
+    os.environ["SQLITE_SHARDS"] = str(args.shards)
+
+    for mode in ("direct", "write-behind"):
+        db_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        result = run(mode, db_url, args.voters, args.threads, args.restaurants, args.groups)
+        print(f"{result['mode']:>13}: {result['votes']} votes in {result['seconds']}s "
+              f"= {result['votes_per_sec']} votes/s (VoteResult total {result['counted']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""餐廳清單的批次匯入／匯出（網頁與 `flask restaurants` 指令共用）。
+
+匯入格式：CSV（第一列為欄位名稱）或 JSON 陣列，欄位 name, phone, hours, menu_url，
+訂餐群組另可帶 favorite（1/true/yes 表示常訂）。
+整批在同一個交易內：一次查出既有名稱比對重複，超過 MAX_RESTAURANTS 則整批不匯入。
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from models import (db, normalize_name, OrderRestaurant, OrderFavorite, VoteRestaurant)
+from sharding import current_shard, shard_context
+
+FIELDS = ("name", "phone", "hours", "menu_url")
+TRUTHY = {"1", "true", "yes", "y", "v", "★"}
+
+
+class ImportRejected(ValueError):
+    """整批匯入被拒絕；訊息可直接顯示給使用者。"""
+
+
+def parse_restaurants(data: str, fmt: str) -> list[dict]:
+    """把 CSV / JSON 文字轉成 [{name, phone, hours, menu_url, favorite}]，欄位長度依資料表截斷。"""
+    if fmt == "json":
+        try:
+            items = json.loads(data)
+        except ValueError as e:
+            raise ImportRejected(f"JSON 格式錯誤：{e}")
+        if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+            raise ImportRejected("JSON 需為物件陣列，例如 [{\"name\": \"...\"}]。")
+    else:
+        items = list(csv.DictReader(io.StringIO(data.lstrip("\ufeff"))))
+    rows = []
+    for item in items:
+        row = {f: str(item.get(f) or "").strip() for f in FIELDS}
+        if not row["name"]:
+            continue
+        for f in FIELDS:
+            row[f] = row[f][:OrderRestaurant.__table__.c[f].type.length]
+        row["favorite"] = str(item.get("favorite") or "").strip().lower() in TRUTHY
+        rows.append(row)
+    return rows
+
+
+def import_restaurants(model, group_id: int, rows: list[dict], max_restaurants: int) -> tuple[int, int]:
+    """匯入到群組（不 commit，由呼叫端 commit）；回傳 (新增數, 重複略過數)。"""
+    unique, seen = [], set()
+    for row in rows:
+        key = normalize_name(row["name"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    existing = set(db.session.scalars(select(model.name_key)
+                                      .where(model.group_id == group_id, model.name_key.in_(seen))))
+    new_rows = [r for r in unique if normalize_name(r["name"]) not in existing]
+    count = db.session.scalar(select(db.func.count()).select_from(model).where(model.group_id == group_id))
+    if count + len(new_rows) > max_restaurants:
+        raise ImportRejected(f"匯入後將有 {count + len(new_rows)} 家，超過上限 {max_restaurants} 家，未匯入任何資料。")
+
+    created = [model(group_id=group_id, **{f: r[f] for f in FIELDS}) for r in new_rows]
+    db.session.add_all(created)
+    if model is OrderRestaurant and any(r["favorite"] for r in new_rows):
+        db.session.flush()
+        db.session.add_all(OrderFavorite(group_id=group_id, order_restaurant_id=obj.id)
+                           for obj, r in zip(created, new_rows) if r["favorite"])
+    return len(created), len(rows) - len(created)
+
+
+def copy_restaurants(source_model, source_group_id: int, target_group_id: int, source_shard: int | None = None) -> int:
+    """以一句 INSERT ... SELECT 把來源群組的餐廳複製到聚餐投票群組（目前分片）。
+
+    來源在其他分片（source_shard，見 sharding.py）時改為先讀出再寫入。
+    """
+    names = ["name", "phone", "hours", "menu_url", "name_key", "catalog_id"]
+    cols = [getattr(source_model, n) for n in names]
+    if source_shard is None or source_shard == current_shard():
+        stmt = (VoteRestaurant.__table__.insert()
+                .from_select(["group_id"] + names,
+                             select(db.literal(target_group_id), *cols)
+                             .where(source_model.group_id == source_group_id)))
+        return db.session.execute(stmt).rowcount
+    with shard_context(source_shard):
+        rows = db.session.execute(select(*cols).where(source_model.group_id == source_group_id)).all()
+    if rows:
+        db.session.execute(VoteRestaurant.__table__.insert(),
+                           [dict(zip(names, row), group_id=target_group_id) for row in rows])
+    return len(rows)
+
+
+def iter_export(model, group_id: int, fmt: str):
+    """逐列產生 CSV / JSON 文字（yield_per 分批讀取，不一次載入全部）；訂餐群組附 favorite 欄。"""
+    favorite = None
+    query = select(*(getattr(model, f) for f in FIELDS)).where(model.group_id == group_id).order_by(model.name)
+    if model is OrderRestaurant:
+        favorite = OrderFavorite.id.isnot(None).label("favorite")
+        query = query.add_columns(favorite).outerjoin(
+            OrderFavorite, (OrderFavorite.order_restaurant_id == OrderRestaurant.id)
+            & (OrderFavorite.group_id == group_id))
+    fields = FIELDS + (("favorite",) if favorite is not None else ())
+    result = db.session.execute(query.execution_options(yield_per=200))
+
+    if fmt == "json":
+        yield "["
+        for i, row in enumerate(result):
+            yield ("," if i else "") + json.dumps(dict(zip(fields, row)), ensure_ascii=False)
+        yield "]\n"
+        return
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for row in result:
+        writer.writerow([int(v) if isinstance(v, bool) else v for v in row])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
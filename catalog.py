@@ -0,0 +1,136 @@
+"""共用餐廳目錄：群組新增餐廳時自動連到目錄，並提供前綴搜尋（自動完成）。
+
+- 連結：flush 前把新的 OrderRestaurant / VoteRestaurant 以（name_key, 電話）upsert 進目錄，
+  填上 catalog_id，並累加 uses（熱門度）。路由、批次匯入都不用另外呼叫。
+- 搜尋：先查記憶體裡的前綴樹（只放最熱門的 CATALOG_TRIE_SIZE 筆，依熱門度排序），
+  不足 limit 筆再用 name_key 索引做範圍查詢（依名稱排序、帶 LIMIT，不需排序整個結果）。
+"""
+import threading
+import time
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from models import db, dialect_insert, normalize_name, OrderRestaurant, VoteRestaurant, RestaurantCatalog
+from sharding import each_shard
+
+FIELDS = ("id", "name", "phone", "hours", "menu_url")
+
+
+class PrefixTrie:
+    """每個節點只保留該前綴最熱門的 k 筆；依熱門度由高到低 insert，查詢為 O(前綴長度)。"""
+
+    def __init__(self, k: int = 8, depth: int = 12):
+        self.k = k
+        self.depth = depth
+        self.root = ({}, [])   # (子節點, 此前綴的前 k 筆)
+        self.size = 0
+
+    def insert(self, key: str, item: dict):
+        node = self.root
+        for ch in key[:self.depth]:
+            node = node[0].setdefault(ch, ({}, []))
+            if len(node[1]) < self.k:
+                node[1].append((key, item))
+        self.size += 1
+
+    def lookup(self, prefix: str) -> list[dict]:
+        node = self.root
+        for ch in prefix[:self.depth]:
+            node = node[0].get(ch)
+            if node is None:
+                return []
+        return [item for key, item in node[1] if key.startswith(prefix)]
+
+
+class CatalogSearch:
+    """每個 worker 一份；前綴樹在第一次搜尋時建立，ttl 秒後重建（重建期間其他請求沿用舊的）。"""
+
+    def __init__(self, warm_size: int = 5000, ttl: float = 600):
+        self.warm_size = warm_size
+        self.ttl = ttl
+        self._trie = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def search(self, q: str, limit: int = 8) -> list[dict]:
+        key = normalize_name(q)
+        if not key:
+            return []
+        results = self._warm_trie().lookup(key)[:limit]
+        if len(results) < limit:
+            seen = {r["id"] for r in results}
+            for row in db.session.execute(_prefix_query(key, limit + len(seen))):
+                if row.id not in seen and len(results) < limit:
+                    results.append(dict(zip(FIELDS, row)))
+        return results
+
+    def _warm_trie(self) -> PrefixTrie:
+        stale = self._trie is None or time.monotonic() - self._built_at > self.ttl
+        if stale and self._lock.acquire(blocking=self._trie is None):
+            try:
+                if self._trie is not None and time.monotonic() - self._built_at <= self.ttl:
+                    return self._trie   # 等鎖期間別人已重建
+                trie = PrefixTrie()
+                if self.warm_size > 0:
+                    rows = db.session.execute(
+                        select(RestaurantCatalog.name_key, *(getattr(RestaurantCatalog, f) for f in FIELDS))
+                        .order_by(RestaurantCatalog.uses.desc()).limit(self.warm_size))
+                    for key, *values in rows:
+                        trie.insert(key, dict(zip(FIELDS, values)))
+                self._trie, self._built_at = trie, time.monotonic()
+            finally:
+                self._lock.release()
+        return self._trie
+
+
+def _prefix_query(key: str, limit: int):
+    columns = [getattr(RestaurantCatalog, f) for f in FIELDS]
+    if db.engine.dialect.name == "postgresql":
+        prefix = RestaurantCatalog.name_key.startswith(key, autoescape=True)   # text_pattern_ops 索引
+    else:
+        # SQLite 的 LIKE 不分大小寫，用不到 BINARY 索引；改成等價的範圍查詢
+        prefix = (RestaurantCatalog.name_key >= key) & (RestaurantCatalog.name_key < key[:-1] + chr(ord(key[-1]) + 1))
+    return select(*columns).where(prefix).order_by(RestaurantCatalog.name_key).limit(limit)
+
+
+def catalog_upsert(name: str, phone: str | None, hours: str | None, menu_url: str | None):
+    """回傳「取得或建立目錄項目並回傳 id」的語句；已存在時 uses + 1，並補上原本空白的營業時間／菜單。"""
+    stmt = dialect_insert(RestaurantCatalog).values(
+        name=name, name_key=normalize_name(name), phone=phone or "", hours=hours, menu_url=menu_url, uses=1)
+    return stmt.on_conflict_do_update(
+        index_elements=["name_key", "phone"],
+        set_={"uses": RestaurantCatalog.uses + 1,
+              "hours": func.coalesce(func.nullif(RestaurantCatalog.hours, ""), stmt.excluded.hours),
+              "menu_url": func.coalesce(func.nullif(RestaurantCatalog.menu_url, ""), stmt.excluded.menu_url)},
+    ).returning(RestaurantCatalog.id)
+
+
+def link_catalog(session, restaurants):
+    conn = session.connection()
+    for r in restaurants:
+        r.catalog_id = conn.execute(catalog_upsert(r.name, r.phone, r.hours, r.menu_url)).scalar_one()
+
+
+@event.listens_for(Session, "before_flush")
+def _link_new_restaurants(session, flush_context, instances):
+    new = [obj for obj in session.new
+           if isinstance(obj, (OrderRestaurant, VoteRestaurant)) and obj.catalog_id is None]
+    if new:
+        link_catalog(session, new)
+
+
+def backfill_catalog(batch_size: int = 500) -> int:
+    """把尚未連到目錄的既有餐廳（所有分片）補上 catalog_id（每批一個交易），回傳處理筆數。"""
+    total = 0
+    for _ in each_shard():
+        for model in (OrderRestaurant, VoteRestaurant):
+            while True:
+                batch = db.session.scalars(select(model).where(model.catalog_id.is_(None))
+                                           .order_by(model.id).limit(batch_size)).all()
+                if not batch:
+                    break
+                link_catalog(db.session, batch)
+                db.session.commit()
+                total += len(batch)
+    return total
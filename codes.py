@@ -0,0 +1,92 @@
+"""邀請代碼配發：序號經金鑰化的 Feistel 置換對應到代碼，保證不重複、不需重試。
+
+- 32 個字元（不含 I、O、0、1）每字 5 bits，6 碼即 2^30 個代碼；序號 0..32^n-1 經置換後一對一
+  對應到同樣範圍，再寫成 n 個字元。不同序號必得不同代碼，無生日碰撞
+- 置換的輪函數為 HMAC-SHA256（金鑰由 SECRET_KEY 衍生，或設定 INVITE_CODE_KEY），
+  相鄰序號的代碼看不出關聯，也無法從已知代碼推出其他代碼
+- 序號以區塊向資料庫預約（code_sequence 一句 UPDATE ... RETURNING 取 CODE_BLOCK_SIZE 個），
+  之後建立群組不需額外查詢
+- 加長：序號超過 32^n 或調高 INVITE_CODE_LENGTH 後改發 n+1 碼；舊代碼長度不同，不會與新代碼重複
+"""
+import hashlib
+import hmac
+import os
+import threading
+
+from models import db, dialect_insert, CodeSequence
+
+ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"   # 不含易混淆字元
+ROUNDS = 6
+SEQUENCE_NAME = "invite"
+
+
+def _feistel(x: int, bits: int, key: bytes) -> int:
+    """bits（偶數）位元上的平衡 Feistel 網路：對 0..2^bits-1 是一對一置換。"""
+    half = bits // 2
+    mask = (1 << half) - 1
+    left, right = x >> half, x & mask
+    for i in range(ROUNDS):
+        digest = hmac.new(key, bytes([i, bits]) + right.to_bytes(8, "big"), hashlib.sha256).digest()
+        left, right = right, left ^ (int.from_bytes(digest[:8], "big") & mask)
+    return (left << half) | right
+
+
+def permute(seq: int, length: int, key: bytes) -> int:
+    """0..32^length-1 上的置換；5*length 為奇數時多用 1 bit，超出範圍就再置換一次（cycle walking）。"""
+    size = len(ALPHABET) ** length
+    if not 0 <= seq < size:
+        raise ValueError(f"sequence {seq} out of range for {length}-character codes")
+    bits = 5 * length + (5 * length) % 2
+    x = _feistel(seq, bits, key)
+    while x >= size:
+        x = _feistel(x, bits, key)
+    return x
+
+
+def encode(n: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        n, r = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[r])
+    return "".join(reversed(chars))
+
+
+def derive_key(secret: str) -> bytes:
+    return hashlib.sha256(b"invite-code:" + secret.encode()).digest()
+
+
+class CodeAllocator:
+    def __init__(self, key: bytes, min_length: int = 6, block_size: int = 64):
+        self.key = key
+        self.min_length = min_length
+        self.block_size = block_size
+        self._next = self._end = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def code_for(self, seq: int) -> str:
+        length = self.min_length
+        while seq >= len(ALPHABET) ** length:
+            length += 1
+        return encode(permute(seq, length, self.key), length)
+
+    def next_code(self) -> str:
+        with self._lock:
+            # fork 之後（gunicorn --preload）子行程不能沿用父行程預約的區塊
+            if self._next >= self._end or self._pid != os.getpid():
+                self._next, self._end = self._reserve()
+                self._pid = os.getpid()
+            seq = self._next
+            self._next += 1
+        return self.code_for(seq)
+
+    def _reserve(self) -> tuple[int, int]:
+        """向資料庫預約 block_size 個序號（獨立連線、立即 commit），回傳 [start, end)。"""
+        table = CodeSequence.__table__
+        with db.engine.begin() as conn:
+            conn.execute(dialect_insert(CodeSequence).values(name=SEQUENCE_NAME, next_value=0)
+                         .on_conflict_do_nothing(index_elements=["name"]))
+            end = conn.execute(table.update().where(table.c.name == SEQUENCE_NAME)
+                               .values(next_value=table.c.next_value + self.block_size)
+                               .returning(table.c.next_value)).scalar_one()
+        return end - self.block_size, end
@@ -0,0 +1,115 @@
+"""群組留言的即時通知（SSE 用的 fan-out）。
+
+- SQLite / 單機：只在本行程內通知等待中的 SSE 連線。
+- Postgres：發文時在同一交易內送出 NOTIFY，每個 gunicorn worker
+  各有一條 LISTEN 連線，收到後再轉給自己行程內的 SSE 連線。
+"""
+import logging
+import select
+import threading
+import time
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "meal_picker_comments"
+
+
+class CommentBus:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._versions: dict[str, int] = {}   # key（例如 "order:12"）→ 本行程看到的通知次數
+        self._engine = None
+        self._use_pg = False
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def init_app(self, app, engine):
+        self._engine = engine
+        self._use_pg = engine.dialect.name == "postgresql"
+        app.extensions["comment_bus"] = self
+
+    # --- 發布端 ---
+    def publish(self, session, key: str):
+        """在 commit 前呼叫：Postgres 走 NOTIFY（commit 時才送出），其他資料庫等 commit 後通知本行程。"""
+        if self._use_pg:
+            session.execute(func.pg_notify(CHANNEL, key).select())
+        else:
+            session.info.setdefault("comment_bus_pending", set()).add(key)
+
+    def _bump(self, keys):
+        with self._cond:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self._cond.notify_all()
+
+    # --- 訂閱端 ---
+    def version(self, key: str) -> int:
+        self._ensure_listener()
+        with self._cond:
+            return self._versions.get(key, 0)
+
+    def wait(self, key: str, seen: int, timeout: float) -> bool:
+        """等到 key 有新通知（回 True）或逾時（回 False）。"""
+        end = time.monotonic() + timeout
+        with self._cond:
+            while self._versions.get(key, 0) == seen:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    # --- Postgres LISTEN（每個 worker 一條，fork 後第一次訂閱時才啟動）---
+    def _ensure_listener(self):
+        if not self._use_pg or (self._listener and self._listener.is_alive()):
+            return
+        with self._listener_lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen_forever, name="comment-bus-listen", daemon=True)
+            self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            raw = None
+            try:
+                raw = self._engine.raw_connection()
+                raw.detach()   # 專用連線，不還回連線池
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    keys = {n.payload for n in conn.notifies}
+                    conn.notifies.clear()
+                    if keys:
+                        self._bump(keys)
+            except Exception:
+                log.exception("comment bus listener lost its connection; retrying")
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                time.sleep(2)
+
+
+comment_bus = CommentBus()
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_pending(session):
+    keys = session.info.pop("comment_bus_pending", None)
+    if keys:
+        comment_bus._bump(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop("comment_bus_pending", None)
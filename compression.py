@@ -0,0 +1,38 @@
+"""動態回應的 gzip 壓縮（HTML 與 JSON，超過 GZIP_MIN_BYTES 才壓）。
+
+留言串流每 5 秒輪詢一次、/order 與 /vote 的整頁 HTML 重複性都很高，壓縮後通常只剩 1/4～1/6。
+- SSE、匯出等串流回應與已指定 Content-Encoding 的回應（預先壓縮的靜態檔）不處理
+- 壓縮後強 ETag 改為弱 ETag（同一內容的不同編碼），If-None-Match 以弱比較判斷
+- 壓縮前後的位元組數記在 /metrics 的 gzip_bytes_in_total / gzip_bytes_out_total
+"""
+import gzip
+
+from flask import request
+
+COMPRESSIBLE = {"text/html", "application/json"}
+
+
+def init_compression(app, min_bytes: int, level: int = 6):
+    if min_bytes <= 0:
+        return
+
+    @app.after_request
+    def gzip_response(resp):
+        if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+                or resp.mimetype not in COMPRESSIBLE or "Content-Encoding" in resp.headers):
+            return resp
+        resp.vary.add("Accept-Encoding")
+        if not request.accept_encodings["gzip"]:
+            return resp
+        data = resp.get_data()
+        if len(data) < min_bytes:
+            return resp
+        resp.set_data(gzip.compress(data, level, mtime=0))
+        resp.headers["Content-Encoding"] = "gzip"
+        etag, weak = resp.get_etag()
+        if etag and not weak:
+            resp.set_etag(etag, weak=True)
+        if metrics := app.extensions.get("metrics"):
+            metrics.inc("gzip_bytes_in_total", len(data))
+            metrics.inc("gzip_bytes_out_total", resp.content_length)
+        return resp
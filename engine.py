@@ -0,0 +1,92 @@
+"""資料庫連線設定檔（DB_PROFILE）：依資料庫種類與 gunicorn worker 數調整 engine。
+
+- auto    ：（預設）SQLite 網址用 sqlite，Postgres 用 postgres
+- basic   ：原本的設定，只有 pool_pre_ping
+- sqlite  ：每條連線設定 WAL、synchronous=NORMAL、busy_timeout、mmap 與 page cache，
+            多個 worker 同時寫入時排隊等待，而不是立刻 "database is locked"
+- postgres：連線池依「每個 worker 同時處理的請求數」配置，總數不超過 DB_MAX_CONNECTIONS；
+            每條連線帶 statement_timeout 與 idle_in_transaction_session_timeout
+
+worker 數與每個 worker 的並行數從 gunicorn.conf.py 匯出的環境變數取得
+（WEB_CONCURRENCY、WORKER_PROFILE、GUNICORN_THREADS、GUNICORN_WORKER_CONNECTIONS）。
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+PROFILES = ("auto", "basic", "sqlite", "postgres")
+BACKGROUND_CONNECTIONS = 2   # 每個 worker 的背景執行緒（票數寫回、過期清理）
+
+
+def _env_int(env, name: str, default: int) -> int:
+    return int(env.get(name) or default)
+
+
+def worker_concurrency(env=os.environ) -> int:
+    """單一 worker 同時處理的請求數上限。"""
+    profile = env.get("WORKER_PROFILE", "sync")
+    if profile == "gthread":
+        return _env_int(env, "GUNICORN_THREADS", 32)
+    if profile == "gevent":
+        return _env_int(env, "GUNICORN_WORKER_CONNECTIONS", 2000)
+    return 1
+
+
+def resolve_profile(db_url: str, env=os.environ) -> str:
+    profile = env.get("DB_PROFILE", "auto")
+    if profile not in PROFILES:
+        raise RuntimeError(f"unknown DB_PROFILE: {profile!r} ({' / '.join(PROFILES)})")
+    if profile == "auto":
+        backend = make_url(db_url).get_backend_name()
+        profile = backend if backend in ("sqlite", "postgresql") else "basic"
+        profile = "postgres" if profile == "postgresql" else profile
+    return profile
+
+
+def engine_options(profile: str, db_url: str, env=os.environ) -> dict:
+    """回傳 SQLALCHEMY_ENGINE_OPTIONS。"""
+    options = {"pool_pre_ping": True}   # 避免閒置連線失效
+    if profile == "sqlite":
+        if make_url(db_url).database not in (None, "", ":memory:"):
+            # 連線很便宜：每個並行請求一條，不在連線池排隊（overflow 同 SQLAlchemy 預設）
+            options.update(pool_size=max(5, min(worker_concurrency(env), 64) + BACKGROUND_CONNECTIONS),
+                           max_overflow=10)
+    elif profile == "postgres":
+        workers = _env_int(env, "WEB_CONCURRENCY", 1)
+        # 預留 10 條給管理、cron 與其他服務；每個 worker 另有 1 條 LISTEN 專用連線（不在池內）
+        budget = max(2, (_env_int(env, "DB_MAX_CONNECTIONS", 100) - 10) // workers - 1)
+        pool_size = _env_int(env, "DB_POOL_SIZE", min(worker_concurrency(env) + BACKGROUND_CONNECTIONS, budget))
+        timeout_ms = _env_int(env, "DB_STATEMENT_TIMEOUT_MS", 5000)
+        options.update(
+            pool_size=pool_size,
+            max_overflow=_env_int(env, "DB_MAX_OVERFLOW", max(0, budget - pool_size)),
+            pool_timeout=_env_int(env, "DB_POOL_TIMEOUT", 5),   # 連線用完時快速失敗，不要卡到 worker timeout
+            pool_recycle=1800,
+            connect_args={"options": f"-c statement_timeout={timeout_ms} "
+                                     f"-c idle_in_transaction_session_timeout={timeout_ms * 6}"},
+        )
+    return options
+
+
+def configure_engine(engine, profile: str, env=os.environ):
+    """在第一條連線建立前呼叫（create_all 之前）。"""
+    if profile != "sqlite":
+        return
+    in_memory = engine.url.database in (None, "", ":memory:")
+    pragmas = {
+        "busy_timeout": _env_int(env, "SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "synchronous": "NORMAL",   # WAL 下只在 checkpoint 時 fsync；斷電最多遺失最後幾筆交易，不會損毀
+        "cache_size": -_env_int(env, "SQLITE_CACHE_MB", 64) * 1024,   # 負數單位為 KiB
+        "temp_store": "MEMORY",
+    }
+    if not in_memory:
+        pragmas = {"journal_mode": "WAL", **pragmas,
+                   "mmap_size": _env_int(env, "SQLITE_MMAP_MB", 256) * 1024 * 1024}
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
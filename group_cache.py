@@ -0,0 +1,70 @@
+"""邀請代碼 → 群組的行程內快取（LRU + TTL）。
+
+代碼產生後就不會再變，所以熱門群組可以跳過每個請求開頭的查詢。
+群組被刪除（過期清理）時呼叫 invalidate；其他 worker 的快取最晚 TTL 秒後失效。
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(frozen=True)
+class VoteMeta:
+    event_at: datetime
+    vote_deadline: datetime
+    votes_per_person: int
+
+
+@dataclass(frozen=True)
+class GroupRef:
+    """唯讀的群組資料；屬性名稱與 ORM 物件相同，模板可直接沿用。"""
+    id: int
+    code: str
+    name: str | None
+    kind: str                     # 'order' / 'vote'
+    meta: VoteMeta | None = None  # 只有聚餐投票群組才有
+    shard: int = 0                # 所在分片（見 sharding.py；未啟用分片時一律 0）
+
+
+class GroupCache:
+    def __init__(self, maxsize: int = 2048, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[tuple[str, str], tuple[float, GroupRef]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, code: str, loader) -> GroupRef | None:
+        """命中就回傳快取；否則呼叫 loader() 查資料庫（查不到的代碼不快取）。"""
+        key = (kind, code)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        ref = loader()
+        if ref is not None:
+            with self._lock:
+                self._data[key] = (now + self.ttl, ref)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return ref
+
+    def invalidate(self, kind: str, code: str):
+        with self._lock:
+            self._data.pop((kind, code), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
@@ -0,0 +1,51 @@
+"""gunicorn 設定：以 WORKER_PROFILE 選擇 worker 類型。
+
+    gunicorn "app:create_app()"                          # 讀取本檔（預設 sync）
+    WORKER_PROFILE=gevent gunicorn "app:create_app()"    # 需 pip install -r requirements-async.txt
+
+- sync    ：原本的行為；每個 worker 同時只處理一個請求。不開 SSE（SSE_ENABLED 預設 0），留言板改用輪詢
+- gthread ：每個 worker 開 GUNICORN_THREADS 條執行緒，可同時掛住同樣數量的長連線（預設開啟 SSE）
+- gevent  ：協程 worker，每個 worker 可掛住 GUNICORN_WORKER_CONNECTIONS（預設 2000）條閒置連線
+
+Flask-SQLAlchemy 的 session 依 app context 區分，而 context 存在 contextvars 中，
+gevent 下每個 greenlet 各有一份，所以每個請求仍各用各的 session。
+SSE 在等待新留言時會先 close session，把連線還給連線池，閒置連線不佔資料庫連線。
+"""
+import multiprocessing
+import os
+
+profile = os.environ.get("WORKER_PROFILE", "sync")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+
+if profile == "gthread":
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", 32))
+elif profile == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 2000))
+elif profile == "sync":
+    worker_class = "sync"
+else:
+    raise RuntimeError(f"unknown WORKER_PROFILE: {profile!r} (sync / gthread / gevent)")
+
+# engine.py 依 worker 數與每個 worker 的並行數配置連線池
+os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+
+# 留言 SSE 只在能同時掛住長連線的 worker 開啟；sync 下每條 SSE 會佔住整個 worker，改由頁面輪詢。
+# 非 sync worker 也不會因為單一請求超過 timeout 被砍，SSE 可以保持較久再讓瀏覽器重連
+if profile != "sync":
+    os.environ.setdefault("SSE_ENABLED", "1")
+    os.environ.setdefault("SSE_STREAM_SECONDS", "300")
+
+
+def post_fork(server, worker):
+    if profile == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:   # 沒裝 psycogreen 時 psycopg2 查詢會阻塞整個 worker（SQLite 不受影響）
+            server.log.warning("psycogreen not installed; Postgres queries will block gevent workers")
+        else:
+            patch_psycopg()
@@ -0,0 +1,54 @@
+"""/order 與 /vote 的頁面資料：群組之外只用一句查詢取回整頁所需的餐廳與票數／常訂。
+
+群組本身（含投票設定）走 group_cache；這裡回傳唯讀的 view 物件，模板不會再觸發 lazy load。
+"""
+from dataclasses import dataclass
+
+from sqlalchemy import select
+
+from models import db, OrderRestaurant, OrderFavorite, VoteRestaurant, VoteResult
+
+
+@dataclass(frozen=True)
+class RestaurantView:
+    id: int
+    name: str
+    phone: str | None
+    hours: str | None
+    menu_url: str | None
+
+
+@dataclass(frozen=True)
+class OrderPage:
+    restaurants: tuple[RestaurantView, ...]   # 依名稱排序
+    fav_ids: frozenset[int]
+
+
+@dataclass(frozen=True)
+class VotePage:
+    restaurants: tuple[RestaurantView, ...]   # 依名稱排序
+    votes: dict[int, int]                     # 只含有票的餐廳
+
+
+def load_order_page(group_id: int) -> OrderPage:
+    rows = db.session.execute(
+        select(OrderRestaurant.id, OrderRestaurant.name, OrderRestaurant.phone, OrderRestaurant.hours,
+               OrderRestaurant.menu_url, OrderFavorite.id.isnot(None))
+        .outerjoin(OrderFavorite, (OrderFavorite.order_restaurant_id == OrderRestaurant.id)
+                   & (OrderFavorite.group_id == group_id))
+        .where(OrderRestaurant.group_id == group_id)
+        .order_by(OrderRestaurant.name.asc())).all()
+    return OrderPage(restaurants=tuple(RestaurantView(*r[:5]) for r in rows),
+                     fav_ids=frozenset(r[0] for r in rows if r[5]))
+
+
+def load_vote_page(group_id: int) -> VotePage:
+    rows = db.session.execute(
+        select(VoteRestaurant.id, VoteRestaurant.name, VoteRestaurant.phone, VoteRestaurant.hours,
+               VoteRestaurant.menu_url, VoteResult.votes)
+        .outerjoin(VoteResult, (VoteResult.vote_restaurant_id == VoteRestaurant.id)
+                   & (VoteResult.group_id == group_id))
+        .where(VoteRestaurant.group_id == group_id)
+        .order_by(VoteRestaurant.name.asc())).all()
+    return VotePage(restaurants=tuple(RestaurantView(*r[:5]) for r in rows),
+                    votes={r[0]: r[5] for r in rows if r[5] is not None})
@@ -0,0 +1,163 @@
+"""每個請求的 SQL 次數／時間、模板渲染時間與總延遲，以 Prometheus 文字格式輸出於 /metrics。
+
+- SQL：掛在 SQLAlchemy engine 的 before/after_cursor_execute 事件
+- 模板：Flask 的 before_render_template / template_rendered 訊號
+- 每個 endpoint 一組固定 bucket 的直方圖，只做加法，額外負擔很小
+設定 QUERY_BUDGET（>0）時，單一請求查詢次數超過就記一筆 warning。
+"""
+import bisect
+import logging
+import threading
+import time
+
+from flask import Response, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後一格是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+HISTOGRAMS = {
+    # 名稱: (說明, buckets)
+    "http_request_duration_seconds": ("Total request latency", SECONDS_BUCKETS),
+    "db_queries_per_request": ("SQL statements per request", QUERY_BUCKETS),
+    "db_duration_seconds": ("Time spent in SQL per request", SECONDS_BUCKETS),
+    "template_render_seconds": ("Time spent rendering templates per request", SECONDS_BUCKETS),
+}
+
+
+class Metrics:
+    def __init__(self, query_budget: int = 0):
+        self.query_budget = query_budget
+        self._lock = threading.Lock()
+        self._hist: dict[tuple[str, str], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._collectors = []
+
+    def init_app(self, app, engine):
+        app.extensions["metrics"] = self
+        self.watch_engine(engine)
+        before_render_template.connect(_before_render, app, weak=False)
+        template_rendered.connect(_after_render, app, weak=False)
+        app.before_request(_start_request)
+        app.teardown_request(self._finish_request)
+
+    def watch_engine(self, engine):
+        """SQL 次數與時間也計入這個 engine（分片）的查詢。"""
+        event.listen(engine, "before_cursor_execute", _before_cursor)
+        event.listen(engine, "after_cursor_execute", _after_cursor)
+
+    # --- 其他模組可加的計數器與收集器 ---
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collect):
+        """collect() 回傳 [(名稱, 類型, {labels}, 值)]，在輸出 /metrics 時呼叫。"""
+        self._collectors.append(collect)
+
+    def observe(self, name: str, endpoint: str, value: float):
+        with self._lock:
+            hist = self._hist.get((name, endpoint))
+            if hist is None:
+                hist = self._hist[(name, endpoint)] = Histogram(HISTOGRAMS[name][1])
+            hist.observe(value)
+
+    def _finish_request(self, exc=None):
+        stats = g.pop("_metrics", None)
+        if stats is None:
+            return
+        endpoint = request.endpoint or "unmatched"
+        self.observe("http_request_duration_seconds", endpoint, time.perf_counter() - stats["start"])
+        self.observe("db_queries_per_request", endpoint, stats["queries"])
+        self.observe("db_duration_seconds", endpoint, stats["db"])
+        self.observe("template_render_seconds", endpoint, stats["render"])
+        if self.query_budget and stats["queries"] > self.query_budget:
+            log.warning("%s %s ran %d SQL statements (budget %d)",
+                        request.method, request.path, stats["queries"], self.query_budget)
+
+    # --- Prometheus 文字格式 ---
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            hists = sorted(self._hist.items())
+            counters = sorted(self._counters.items())
+        for name, (help_text, _) in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (hname, endpoint), h in hists:
+                if hname != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{endpoint="{endpoint}"}} {h.count}')
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_labels(dict(labels))} {value:g}")
+        for collect in self._collectors:
+            for name, kind, labels, value in collect():
+                if name not in seen:
+                    lines.append(f"# TYPE {name} {kind}")
+                    seen.add(name)
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def _start_request():
+    g._metrics = {"start": time.perf_counter(), "queries": 0, "db": 0.0, "render": 0.0, "render_start": None}
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "_metrics" in g:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is not None and has_request_context() and "_metrics" in g:
+        g._metrics["queries"] += 1
+        g._metrics["db"] += time.perf_counter() - start
+
+
+def _before_render(sender, template, context, **extra):
+    if "_metrics" in g:
+        g._metrics["render_start"] = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    stats = g.get("_metrics")
+    if stats and stats["render_start"] is not None:
+        stats["render"] += time.perf_counter() - stats["render_start"]
+        stats["render_start"] = None
@@ -1,8 +1,60 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import validates
 
-db = SQLAlchemy()
+from sharding import ShardedSession
+
+db = SQLAlchemy(session_options={"class_": ShardedSession})   # 未啟用分片時與預設 Session 相同
+
+
+def dialect_insert(model):
+    """回傳目前資料庫方言的 INSERT（支援 on_conflict_do_*，SQLite 與 Postgres 通用）。"""
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def normalize_code(code: str | None) -> str:
+    """邀請代碼一律以大寫存放與查詢（可直接用 code 欄位的唯一索引）。"""
+    return (code or "").strip().upper()
+
+
+def normalize_name(name: str | None) -> str:
+    """餐廳名稱比對用的鍵：去頭尾空白、不分大小寫。"""
+    return (name or "").strip().casefold()
+
+
+def ensure_schema(engine=None, tables=None):
+    """create_all 只會建立缺少的資料表；既有資料表新增的欄位（須可為 NULL）與索引在這裡補上。
+
+    engine / tables 給分片用（見 sharding.py）；預設為主資料庫的全部資料表。
+    """
+    engine = engine or db.engine
+    tables = tables or db.metadata.sorted_tables
+    existing = {table: {c["name"] for c in inspect(engine).get_columns(table.name)} for table in tables}
+    with engine.begin() as conn:
+        for table, columns in existing.items():
+            for col in table.columns:
+                if col.name not in columns:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+    for table in tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    backfill_keys()
+
+
+def backfill_keys():
+    """一次性回填：舊資料的代碼轉大寫、補上餐廳 name_key（已回填過時只剩兩個便宜的檢查）。"""
+    for group_model in (OrderGroup, VoteGroup):
+        (group_model.query.filter(group_model.code != db.func.upper(group_model.code))
+         .update({group_model.code: db.func.upper(group_model.code)}, synchronize_session=False))
+    for model in (OrderRestaurant, VoteRestaurant):
+        for r in model.query.filter(model.name_key.is_(None)).yield_per(500):
+            r.name_key = normalize_name(r.name)
+    db.session.commit()
 
 
 
@@ -12,6 +64,7 @@ class OrderGroup(db.Model):
     code = db.Column(db.String(12), unique=True, nullable=False)
     name = db.Column(db.String(120), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_active_at = db.Column(db.DateTime, nullable=True)   # 最後被開啟的時間（每天最多更新一次，見 retention.py）
 
     def __repr__(self):
         return f"<OrderGroup {self.code}>"
@@ -36,6 +89,25 @@ class VoteGroup(db.Model):
 
 
 
+# === 共用餐廳目錄：各群組新增的餐廳以（名稱, 電話）去重後存一份，供搜尋／自動完成 ===
+class RestaurantCatalog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    name_key = db.Column(db.String(120), nullable=False)   # normalize_name(name)，前綴搜尋用
+    phone = db.Column(db.String(50), nullable=False, default="")
+    hours = db.Column(db.String(120), nullable=True)
+    menu_url = db.Column(db.String(300), nullable=True)
+    uses = db.Column(db.Integer, nullable=False, default=1)   # 被幾個群組加入過（熱門排序用）
+
+    __table_args__ = (
+        UniqueConstraint('name_key', 'phone', name='uq_catalog_name_phone'),
+        # Postgres 非 C collation 時，LIKE 'abc%' 要 text_pattern_ops 的索引才走得到
+        # （SQLite 直接用上面唯一索引做範圍查詢，不另建）
+        db.Index('ix_catalog_name_key', 'name_key',
+                 postgresql_ops={'name_key': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_catalog_uses', 'uses'),
+    )
+
 # === 每個「訂餐揪團」群組自己的餐廳 ===
 class OrderRestaurant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -44,9 +116,18 @@ class OrderRestaurant(db.Model):
     phone = db.Column(db.String(50), nullable=True)
     hours = db.Column(db.String(120), nullable=True)
     menu_url = db.Column(db.String(300), nullable=True)
+    name_key = db.Column(db.String(120), nullable=True)   # normalize_name(name)，查重用
+    catalog_id = db.Column(db.Integer, db.ForeignKey('restaurant_catalog.id'), nullable=True)  # 共用餐廳目錄
 
     group = db.relationship('OrderGroup', backref='restaurants', lazy=True)
 
+    __table_args__ = (db.Index('ix_orest_group_name_key', 'group_id', 'name_key'),)
+
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_name(value)
+        return value
+
 # 訂餐揪團：群組常訂（指向「群組自己的餐廳」）
 class OrderFavorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -66,9 +147,18 @@ class VoteRestaurant(db.Model):
     phone = db.Column(db.String(50), nullable=True)
     hours = db.Column(db.String(120), nullable=True)
     menu_url = db.Column(db.String(300), nullable=True)
+    name_key = db.Column(db.String(120), nullable=True)   # normalize_name(name)，查重用
+    catalog_id = db.Column(db.Integer, db.ForeignKey('restaurant_catalog.id'), nullable=True)  # 共用餐廳目錄
 
     group = db.relationship('VoteGroup', backref='restaurants', lazy=True)
 
+    __table_args__ = (db.Index('ix_vrest_group_name_key', 'group_id', 'name_key'),)
+
+    @validates('name')
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_name(value)
+        return value
+
 # 聚餐投票：票數（指向「群組自己的餐廳」）
 class VoteResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -94,6 +184,8 @@ class OrderComment(db.Model):
 
     group = db.relationship('OrderGroup', backref='comments', lazy=True)
 
+    __table_args__ = (db.Index('ix_ocomment_group_created', 'group_id', 'created_at'),)   # 列表與修剪都依此排序
+
 # --- 聚餐投票：群組留言 ---
 class VoteComment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -104,6 +196,8 @@ class VoteComment(db.Model):
 
     group = db.relationship('VoteGroup', backref='comments', lazy=True)
 
+    __table_args__ = (db.Index('ix_vcomment_group_created', 'group_id', 'created_at'),)   # 列表與修剪都依此排序
+
 
 
 
@@ -121,35 +215,72 @@ class VoteGroupMeta(db.Model):
     __table_args__ = (
         db.Index('ix_vgmeta_group', 'group_id'),
         db.Index('ix_vgmeta_deadline', 'vote_deadline'),
+        db.Index('ix_vgmeta_event_at', 'event_at'),   # 過期清理用
     )
 
-# 聚餐投票：投票憑證（限制：每人同餐廳只能投一次；並統計每人使用票數）
-class VoteBallot(db.Model):
+# 聚餐投票：選票帳本（每一票一列、只新增不修改；票數由 VoteResult 累加，見 votes.py）
+# 只有一個唯一鍵 (group_id, client_id, slot)：slot 為此人在此群組的第幾票，
+# 同一人同時送出的票會搶同一個 slot，只有一筆成功；同餐廳一次與配額都在同一句 INSERT 內檢查
+class VoteLedger(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     group_id = db.Column(db.Integer, db.ForeignKey('vote_group.id'), nullable=False)
-    nickname = db.Column(db.String(10), nullable=False)  # 你已將暱稱限制為 10
+    client_id = db.Column(db.String(64), nullable=False)   # 來自 session 的匿名 ID
+    nickname = db.Column(db.String(10), nullable=False)    # 投票當下的暱稱（顯示用）
     vote_restaurant_id = db.Column(db.Integer, db.ForeignKey('vote_restaurant.id'), nullable=False)
+    slot = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
 
-    group = db.relationship('VoteGroup', backref='ballots', lazy=True)
-    vote_restaurant = db.relationship('VoteRestaurant', lazy=True)
+    __table_args__ = (UniqueConstraint('group_id', 'client_id', 'slot', name='uq_ledger_slot'),)
 
-    __table_args__ = (
-        db.UniqueConstraint('group_id', 'nickname', 'vote_restaurant_id', name='uq_ballot_once_per_rest'),
-        db.Index('ix_ballot_group_nick', 'group_id', 'nickname'),
-    )
 
 
+# 群組版本號：留言、票數有變動就 +1，讓輪詢端點用 ETag 回 304（另開表，不改群組表結構）
+class GroupVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(8), nullable=False)      # 'order' / 'vote'
+    group_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint('scope', 'group_id', name='uq_group_version'),)
+
 
-# 建立匿名投票憑證表
-class VoteToken(db.Model):
+# 聚餐投票：截止後的結果快照（排名、票數、勝出者的 JSON；見 snapshots.py）
+class VoteSnapshot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey('vote_group.id'), nullable=False)
-    client_id = db.Column(db.String(64), nullable=False)   # 來自 session 的匿名 ID
-    vote_restaurant_id = db.Column(db.Integer, db.ForeignKey('vote_restaurant.id'), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey('vote_group.id'), nullable=False, unique=True)
+    data = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
 
-    __table_args__ = (
-        db.UniqueConstraint('group_id', 'client_id', 'vote_restaurant_id', name='uq_token_once_per_rest'),
-        db.Index('ix_token_group_client', 'group_id', 'client_id'),
-    )
+
+# 邀請代碼序號（見 codes.py）：各 worker 一次預約一段
+class CodeSequence(db.Model):
+    name = db.Column(db.String(32), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# 閒置訂餐群組的封存（見 retention.py）：群組與子資料壓成一列 gzip JSON，用原代碼開啟時還原
+class OrderGroupArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(12), unique=True, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+
+# 伺服器端 session（SESSION_BACKEND=db 時使用；cookie 只放 sid）
+class ServerSession(db.Model):
+    sid = db.Column(db.String(32), primary_key=True)
+    data = db.Column(db.Text, nullable=False)   # JSON
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# 流量限制的共用 token bucket（RATE_LIMIT_BACKEND=db 時使用）
+class RateBucket(db.Model):
+    key = db.Column(db.String(120), primary_key=True)   # 動作:群組:使用者
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)    # epoch 秒
+
+
+# 讀取副本的心跳（見 replica.py）：主庫定期寫入時間，副本上讀到的時間可估算複寫延遲
+class ReplicaHeartbeat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,73 @@
+"""寫入請求的流量限制（token bucket）：留言與投票在做任何資料庫寫入前先檢查。
+
+每個 (動作, 群組代碼, 使用者) 一個桶；使用者以 session 的 cid 識別，沒有 cid（例如不帶 cookie 的腳本）
+就用來源 IP。規則寫成 "N/S"：容量 N、每 S 秒補滿（平均 N/S 個/秒），"0" 表示不限制。
+- memory：每個 worker 各自計算（預設，完全不碰資料庫）
+- db    ：所有 worker 共用 rate_bucket 資料表，一句 upsert 完成「補充 + 扣一個」
+被擋下的請求記在 /metrics 的 rate_limited_total。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import case
+
+from models import db, dialect_insert, RateBucket
+
+
+def parse_rule(rule: str) -> tuple[float, float] | None:
+    """'5/10' → (容量 5, 每秒補 0.5)；'0' 或空字串 → None（不限制）。"""
+    if not rule or rule.strip() == "0":
+        return None
+    capacity, _, seconds = rule.partition("/")
+    capacity, seconds = float(capacity), float(seconds or 1)
+    return capacity, capacity / seconds
+
+
+class MemoryBuckets:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()   # key → (tokens, 時間)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> bool:
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_keys:   # 最久沒用的桶早已補滿，丟掉等於重新開始
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class DbBuckets:
+    def take(self, key: str, capacity: float, rate: float, now: float) -> bool:
+        refilled = RateBucket.tokens + (now - RateBucket.updated_at) * rate
+        refilled = case((refilled > capacity, capacity), else_=refilled)
+        stmt = dialect_insert(RateBucket).values(key=key, tokens=capacity - 1, updated_at=now)
+        stmt = stmt.on_conflict_do_update(index_elements=["key"],
+                                          set_={"tokens": refilled - 1, "updated_at": now},
+                                          where=refilled >= 1)
+        # 獨立連線、立即 commit：不把限流計數混進請求本身的交易
+        with db.engine.begin() as conn:
+            return conn.execute(stmt).rowcount == 1
+
+
+class RateLimiter:
+    def __init__(self, rules: dict[str, str], backend: str = "memory"):
+        self.rules = {action: parse_rule(rule) for action, rule in rules.items()}
+        if backend not in ("memory", "db"):
+            raise RuntimeError(f"unknown RATE_LIMIT_BACKEND: {backend!r} (memory / db)")
+        self.backend = backend
+        self.buckets = DbBuckets() if backend == "db" else MemoryBuckets()
+
+    def allow(self, action: str, key: str) -> bool:
+        rule = self.rules.get(action)
+        if rule is None:
+            return True
+        return self.buckets.take(f"{action}:{key}"[:120], *rule, time.time())
+
+    def retry_after(self, action: str) -> int:
+        capacity, rate = self.rules[action]
+        return max(1, round(1 / rate))
@@ -0,0 +1,146 @@
+"""讀取副本（選用，設定 READ_DATABASE_URL 啟用）。
+
+/order、/vote 與留言輪詢都是讀取；啟用後 GET / HEAD 請求的 SELECT 走副本，主庫只處理寫入。
+- 其他請求（POST 等）、FOR UPDATE、以及同一個 session 寫入過之後的查詢一律走主庫
+- 寫入過的請求回應帶一個短效 cookie（READ_REPLICA_MAX_LAG_SECONDS 秒），期間同一個瀏覽器的
+  GET 也走主庫：送出留言、投票後重新導向的頁面一定看得到自己剛寫的資料
+- server session、限流桶、代碼序號是每個請求都會讀寫的狀態，永遠走主庫
+- 背景執行緒每 READ_REPLICA_CHECK_SECONDS 秒在主庫寫一次心跳（replica_heartbeat），再讀副本上的那一列：
+  讀不到、連不上或落後超過 READ_REPLICA_MAX_LAG_SECONDS 秒就改回主庫，恢復後自動切回。
+  副本上的查詢出錯也會立刻標記為不可用（進行中的那個請求仍會失敗）
+複寫本身交給資料庫（Postgres streaming replication、litestream 等）；本機測試可用
+`flask replica sync`（SQLite）把主庫複製到副本。SQLITE_SHARDS > 1 時群組資料表仍走各自的分片。
+"""
+import logging
+import math
+import threading
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from sqlalchemy import event, select
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+from models import db, dialect_insert, ReplicaHeartbeat
+from sharding import statement_tables
+
+log = logging.getLogger(__name__)
+
+READ_METHODS = frozenset({"GET", "HEAD"})
+PRIMARY_TABLES = frozenset({"server_session", "rate_bucket", "code_sequence"})
+STICKY_COOKIE = "read_primary"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)   # 資料庫內為 naive UTC
+
+
+def use_primary():
+    """這個請求之後的查詢都走主庫（讀到的資料接著要拿來寫入、或必須是最新的時候）。"""
+    g.read_primary = True
+
+
+class ReplicaRouter:
+    def __init__(self, max_lag: float = 5, check_interval: float = 1):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.app = None
+        self.engine = None
+        self.primary = None
+        self.healthy = False
+        self.lag: float | None = None
+        self.failovers = 0
+        self._stop = threading.Event()
+
+    def init_app(self, app, primary, engine):
+        app.extensions["read_replica"] = self
+        self.app, self.primary, self.engine = app, primary, engine
+        event.listen(engine, "handle_error", self._on_error)
+        app.after_request(self._stick)
+        self.check()
+        threading.Thread(target=self._run, name="replica-monitor", daemon=True).start()
+
+    # --- 路由（ShardedSession.get_bind 呼叫）---
+    def serving(self, session) -> bool:
+        """這個請求目前的讀取是否走副本。"""
+        return (self.healthy and has_request_context() and request.method in READ_METHODS
+                and not session.info.get("primary") and not g.get("read_primary")
+                and STICKY_COOKIE not in request.cookies)
+
+    def bind_for(self, session, mapper, clause):
+        """GET 的唯讀查詢回傳副本 engine；其他情況回 None（走主庫）。"""
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            # 寫入（含 flush）或無法判斷的語句：這個 session 之後的讀取也留在主庫
+            session.info["primary"] = True
+            if isinstance(clause, UpdateBase) or (clause is None and mapper is not None):
+                session.info["wrote"] = True
+            return None
+        if not self.serving(session):
+            return None
+        if any(t.name in PRIMARY_TABLES for t in statement_tables(mapper, clause)):
+            return None
+        return self.engine
+
+    def _stick(self, resp):
+        if request.method not in READ_METHODS or db.session.info.get("wrote"):
+            resp.set_cookie(STICKY_COOKIE, "1", max_age=math.ceil(self.max_lag),
+                            httponly=True, samesite="Lax")
+        return resp
+
+    # --- 健康檢查 ---
+    def check(self) -> bool:
+        """寫一次心跳，讀副本上的心跳估算延遲；回傳副本是否可用。"""
+        now = _utcnow()
+        try:
+            with self.app.app_context(), self.primary.begin() as conn:   # dialect_insert 需要 app context
+                stmt = dialect_insert(ReplicaHeartbeat).values(id=1, beat_at=now)
+                conn.execute(stmt.on_conflict_do_update(index_elements=["id"],
+                                                        set_={"beat_at": stmt.excluded.beat_at}))
+            with self.engine.connect() as conn:
+                beat = conn.scalar(select(ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == 1))
+        except Exception as exc:
+            self._set(False, None, f"replica check failed: {exc}")
+            return False
+        lag = max(0.0, (now - beat).total_seconds()) if beat else None
+        if lag is None or lag > self.max_lag:
+            self._set(False, lag, f"replica lagging ({'no heartbeat' if lag is None else f'{lag:.1f}s'})")
+        else:
+            self._set(True, lag, "replica healthy")
+        return self.healthy
+
+    def _set(self, healthy: bool, lag: float | None, message: str):
+        if healthy != self.healthy:
+            if not healthy:
+                self.failovers += 1
+            (log.info if healthy else log.warning)("%s; reads go to the %s", message,
+                                                   "replica" if healthy else "primary")
+        self.healthy, self.lag = healthy, lag
+
+    def _on_error(self, context):
+        if self.healthy:
+            self._set(False, self.lag, f"replica query failed: {context.original_exception}")
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self) -> list[tuple]:
+        """給 /metrics 的收集器。"""
+        return [
+            ("replica_healthy", "gauge", {}, int(self.healthy)),
+            ("replica_lag_seconds", "gauge", {}, -1 if self.lag is None else round(self.lag, 3)),
+            ("replica_failovers_total", "counter", {}, self.failovers),
+        ]
+
+
+def sync_sqlite(primary, replica):
+    """本機測試用：以 SQLite backup API 把主庫整個複製到副本檔。"""
+    src, dst = primary.raw_connection(), replica.raw_connection()
+    try:
+        src.driver_connection.backup(dst.driver_connection)
+    finally:
+        src.close()
+        dst.close()
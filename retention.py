@@ -0,0 +1,183 @@
+"""閒置訂餐群組的封存與還原。
+
+訂餐群組沒有到期日，餐廳、常訂與留言只會越積越多。`flask archive-idle`（或背景 sweeper，
+設定 ARCHIVE_IDLE_DAYS 時）把超過 N 天沒有人開啟的群組連同子資料壓成一列 gzip JSON，
+移到 order_group_archive，熱資料表只留仍在使用的群組。
+之後有人用原本的代碼開啟時，get_order_group 查不到就從封存還原（單一交易，id 重新配發）。
+寫入路徑以 guard_order_group 確認群組在 commit 時仍然存在：其他 worker 的 group_cache 可能還留著
+已封存群組的 GroupRef，沒有這道檢查，寫入會掛在已刪除的群組 id 底下、永遠讀不到。
+"""
+import gzip
+import json
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, event, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import (db, OrderGroup, OrderRestaurant, OrderFavorite, OrderComment,
+                    OrderGroupArchive, GroupVersion)
+from sharding import current_engine, current_shard, each_shard
+
+RESTAURANT_FIELDS = ("id", "name", "phone", "hours", "menu_url", "name_key", "catalog_id")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)   # 資料庫內為 naive UTC
+
+
+def _iso(dt: datetime | None) -> str | None:
+    return dt.isoformat() if dt else None
+
+
+def _parse(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+class GroupArchived(Exception):
+    """寫入中的訂餐群組已被封存；呼叫端 rollback、清掉快取後重試（重新查詢時會從封存還原）。"""
+
+
+def _alive(session, group_id: int) -> bool:
+    # FOR SHARE（Postgres）：封存的 UPDATE 會等這個交易結束；SQLite 忽略，改靠 commit 前的再次確認
+    return session.execute(select(OrderGroup.id).where(OrderGroup.id == group_id)
+                           .with_for_update(read=True)).first() is not None
+
+
+def guard_order_group(group_id: int):
+    """寫入訂餐群組的子資料前呼叫：確認群組仍在，並在這個 session 下一次 commit 前再確認一次。"""
+    if not _alive(db.session, group_id):
+        raise GroupArchived(group_id)
+    db.session.info["order_group_guard"] = group_id
+
+
+@event.listens_for(Session, "before_commit")
+def _recheck_guard(session):
+    # SQLite 上 commit 前這個交易已持有寫入鎖，封存要嘛已經 commit（這裡看得到），要嘛得等我們結束
+    group_id = session.info.pop("order_group_guard", None)
+    if group_id is not None and not _alive(session, group_id):
+        raise GroupArchived(group_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_guard(session):
+    session.info.pop("order_group_guard", None)
+
+
+class ActivityTracker:
+    """記錄群組最後被開啟的日期：每個群組每天（每個 worker）最多一句 UPDATE。"""
+
+    def __init__(self):
+        self._day: date | None = None
+        self._seen: set[tuple[int, int]] = set()   # (分片, 群組 id)
+        self._lock = threading.Lock()
+
+    def touch(self, group_id: int):
+        now = _utcnow()
+        key = (current_shard(), group_id)
+        with self._lock:
+            if self._day != now.date():
+                self._day, self._seen = now.date(), set()
+            if key in self._seen:
+                return
+            self._seen.add(key)
+        with current_engine(db).begin() as conn:
+            conn.execute(update(OrderGroup)
+                         .where(OrderGroup.id == group_id,
+                                or_(OrderGroup.last_active_at.is_(None),
+                                    OrderGroup.last_active_at < now - timedelta(days=1)))
+                         .values(last_active_at=now))
+
+
+def archive_idle_order_groups(idle_days: int, batch_size: int = 100, now: datetime | None = None) -> dict[str, int]:
+    """封存超過 idle_days 天未開啟的訂餐群組（每個分片依序處理），每批一個交易；回傳各資料表搬走的筆數。
+
+    每批先以一句 UPDATE 鎖住群組（SQLite：取得寫入鎖；Postgres：鎖住這幾列，寫入端 guard_order_group
+    的 FOR SHARE 會等封存結束），之後讀出的子資料到刪除為止都不會再變，不會漏掉封存期間寫入的留言或餐廳。
+    """
+    cutoff = (now or _utcnow()) - timedelta(days=idle_days)
+    idle = db.func.coalesce(OrderGroup.last_active_at, OrderGroup.created_at) < cutoff
+    moved = Counter()
+    for _ in each_shard():
+        while True:
+            candidates = db.session.scalars(select(OrderGroup.id).where(idle)
+                                            .order_by(OrderGroup.id).limit(batch_size)).all()
+            if not candidates:
+                break
+            # 同時再確認一次仍然閒置（挑選之後可能剛有人開啟）
+            locked = db.session.scalars(update(OrderGroup).where(OrderGroup.id.in_(candidates), idle)
+                                        .values(last_active_at=OrderGroup.last_active_at)
+                                        .returning(OrderGroup.id)
+                                        .execution_options(synchronize_session=False)).all()
+            if not locked:
+                db.session.commit()
+                continue
+            groups = db.session.execute(
+                select(OrderGroup.id, OrderGroup.code, OrderGroup.name, OrderGroup.created_at, OrderGroup.last_active_at)
+                .where(OrderGroup.id.in_(locked)).order_by(OrderGroup.id)).all()
+            ids = [g.id for g in groups]
+            restaurants, favorites, comments = {}, {}, {}
+            for row in db.session.execute(select(OrderRestaurant.group_id, *(getattr(OrderRestaurant, f)
+                                                                             for f in RESTAURANT_FIELDS))
+                                          .where(OrderRestaurant.group_id.in_(ids))):
+                restaurants.setdefault(row[0], []).append(list(row[1:]))
+            for gid, rid in db.session.execute(select(OrderFavorite.group_id, OrderFavorite.order_restaurant_id)
+                                               .where(OrderFavorite.group_id.in_(ids))):
+                favorites.setdefault(gid, []).append(rid)
+            for gid, nickname, message, created_at in db.session.execute(
+                    select(OrderComment.group_id, OrderComment.nickname, OrderComment.message, OrderComment.created_at)
+                    .where(OrderComment.group_id.in_(ids)).order_by(OrderComment.id)):
+                comments.setdefault(gid, []).append([nickname, message, _iso(created_at)])
+
+            archived_at = _utcnow()
+            db.session.execute(insert(OrderGroupArchive), [{
+                "code": g.code,
+                "archived_at": archived_at,
+                "payload": gzip.compress(json.dumps({
+                    "name": g.name, "created_at": _iso(g.created_at), "last_active_at": _iso(g.last_active_at),
+                    "restaurants": restaurants.get(g.id, []),
+                    "favorites": favorites.get(g.id, []),
+                    "comments": comments.get(g.id, []),
+                }, ensure_ascii=False, separators=(",", ":")).encode()),
+            } for g in groups])
+            for model in (OrderFavorite, OrderComment, OrderRestaurant):
+                moved[model.__tablename__] += db.session.execute(
+                    delete(model).where(model.group_id.in_(ids))).rowcount
+            db.session.execute(delete(GroupVersion).where(GroupVersion.scope == "order", GroupVersion.group_id.in_(ids)))
+            moved[OrderGroup.__tablename__] += db.session.execute(delete(OrderGroup).where(OrderGroup.id.in_(ids))).rowcount
+            db.session.commit()
+            cache = current_app.extensions.get("group_cache")
+            if cache:
+                for g in groups:
+                    cache.invalidate("order", g.code)
+    return {table: n for table, n in moved.items() if n}
+
+
+def restore_order_group(code: str) -> OrderGroup | None:
+    """從封存還原群組與子資料（不 commit，由呼叫端 commit）；沒有封存回 None。"""
+    archive = db.session.scalar(select(OrderGroupArchive).where(OrderGroupArchive.code == code)
+                                .with_for_update())
+    if archive is None:
+        return None
+    data = json.loads(gzip.decompress(archive.payload))
+    group = OrderGroup(code=code, name=data["name"], created_at=_parse(data["created_at"]),
+                       last_active_at=_utcnow())
+    db.session.add(group)
+    db.session.flush()
+
+    new_ids = {}
+    for row in data["restaurants"]:
+        values = dict(zip(RESTAURANT_FIELDS, row))
+        old_id = values.pop("id")
+        new_ids[old_id] = db.session.execute(
+            insert(OrderRestaurant).values(group_id=group.id, **values).returning(OrderRestaurant.id)).scalar_one()
+    if data["favorites"]:
+        db.session.execute(insert(OrderFavorite), [
+            {"group_id": group.id, "order_restaurant_id": new_ids[rid]} for rid in data["favorites"] if rid in new_ids])
+    if data["comments"]:
+        db.session.execute(insert(OrderComment), [
+            {"group_id": group.id, "nickname": n, "message": m, "created_at": _parse(t)} for n, m, t in data["comments"]])
+    db.session.delete(archive)
+    return group
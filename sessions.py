@@ -0,0 +1,117 @@
+"""伺服器端 session（選用，設定 SESSION_BACKEND=db 啟用）。
+
+預設的 Flask session 把整包資料（cid、各群組暱稱、flash 訊息）簽章後放在 cookie，
+每個請求（包括每 5 秒的留言輪詢）都要帶著、也都要驗章與解碼。
+啟用後 cookie 只放一個 22 字元的隨機 id，資料存在 server_session 資料表：
+- 延遲載入：請求沒有讀寫 session 就不查資料庫（輪詢、SSE、/metrics 等）
+- 只有內容有變更時才寫回；沒變更但超過一天沒寫過時順便更新 updated_at，
+  超過 SESSION_MAX_AGE_DAYS 沒更新的由 sweeper 刪除
+"""
+import json
+import re
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from models import db, dialect_insert, ServerSession
+
+SID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{22}$")
+TOUCH_AFTER = timedelta(days=1)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)   # 資料庫內為 naive UTC
+
+
+class LazySession(CallbackDict, SessionMixin):
+    """第一次讀寫時才從資料庫載入的 session。"""
+
+    def __init__(self, sid: str | None, loader):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(None, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.loaded = sid is None
+        self._loader = loader
+
+    def _load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        data, stale = self._loader(self.sid)
+        if data is None:   # id 不存在（已清除）→ 當成新的 session
+            self.sid, self.new = None, True
+            return
+        dict.update(self, data)
+        if stale:
+            self.modified = True
+
+
+def _loading(name):
+    def method(self, *args, **kwargs):
+        self._load()
+        return getattr(CallbackDict, name)(self, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in ("__getitem__", "__setitem__", "__delitem__", "__contains__", "__iter__", "__len__",
+              "get", "keys", "values", "items", "copy", "setdefault", "pop", "popitem", "update", "clear"):
+    setattr(LazySession, _name, _loading(_name))
+
+
+class DbSessionInterface(SessionInterface):
+    def __init__(self, max_age_days: int = 30):
+        self.max_age = timedelta(days=max_age_days)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        return LazySession(sid if sid and SID_PATTERN.match(sid) else None, self._load)
+
+    def _load(self, sid: str):
+        row = db.session.get(ServerSession, sid)
+        if row is None:
+            return None, False
+        return json.loads(row.data), row.updated_at < _utcnow() - TOUCH_AFTER
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.loaded and session.sid:
+            response.vary.add("Cookie")
+        if not session.modified:
+            return
+
+        data = dict(session)
+        if not data:
+            if session.sid:
+                with db.engine.begin() as conn:
+                    conn.execute(db.delete(ServerSession).where(ServerSession.sid == session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        sid = session.sid or secrets.token_urlsafe(16)
+        stmt = dialect_insert(ServerSession).values(sid=sid, data=json.dumps(data, ensure_ascii=False,
+                                                                               separators=(",", ":")),
+                                                    updated_at=_utcnow())
+        stmt = stmt.on_conflict_do_update(index_elements=["sid"],
+                                          set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at})
+        # 用獨立連線寫入：不受 view 內 db.session 的交易狀態影響
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+        if session.new or session.sid != sid or session.permanent:
+            response.set_cookie(name, sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def purge(self) -> int:
+        """刪除超過 max_age 沒有更新的 session，回傳筆數。"""
+        result = db.session.execute(db.delete(ServerSession)
+                                    .where(ServerSession.updated_at < _utcnow() - self.max_age))
+        db.session.commit()
+        return result.rowcount
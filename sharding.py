@@ -0,0 +1,221 @@
+"""SQLite 分片（SQLITE_SHARDS > 1 時啟用）：每個群組依邀請代碼的雜湊放在其中一個資料庫檔。
+
+群組之間彼此獨立，分開放之後不同群組的寫入各自鎖自己的檔案，可以同時進行。
+- 分片 0 就是 DATABASE_URL 本身（升級前的資料都在這裡）；分片 i 為同目錄的 <檔名>.shard<i>.db
+- 群組相關資料表（群組、餐廳、常訂、留言、票、版本號、封存）每個分片各一份；
+  共用資料表（餐廳目錄、代碼序號、server session、限流桶）只在分片 0
+- ShardedSession.get_bind 依資料表決定 engine：群組資料表走目前請求的分片（g.shard），其他走預設 engine
+  （設定 READ_DATABASE_URL 時，GET 的唯讀查詢改走讀取副本，見 replica.py）。
+  get_order_group / get_vote_group 找到群組後呼叫 use_shard 切換，handler 不需要知道分片
+- 群組的家 = crc32(代碼) % N；找不到時依序查其他分片（調整 N 之後、rebalance 之前）。
+  `flask shards rebalance` 把不在家的群組搬回家（id 重新配發，執行期間請停機或暫停寫入）
+同一個分片檔內的群組 id 由各檔自行遞增，不同分片可能重複；行程內以 id 為鍵的結構
+（票數緩衝、最後開啟時間）改用 (分片, id) 為鍵。
+"""
+import zlib
+from contextlib import contextmanager
+
+import flask_sqlalchemy.session
+from flask import current_app, g, has_app_context
+from sqlalchemy import Table, delete, insert, inspect, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
+
+GLOBAL_TABLES = frozenset({"restaurant_catalog", "code_sequence", "server_session", "rate_bucket",
+                           "replica_heartbeat"})
+
+
+def shard_for(code: str, count: int) -> int:
+    return zlib.crc32(code.upper().encode()) % count
+
+
+def shard_urls(db_url: str, count: int) -> list[str]:
+    """分片 0 為 db_url 本身，其餘放在同一個目錄。"""
+    url = make_url(db_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        raise RuntimeError("SQLITE_SHARDS requires a file-based sqlite:/// DATABASE_URL")
+    stem, dot, ext = url.database.rpartition(".")
+    if not dot:
+        stem, ext = url.database, "db"
+    return [db_url] + [url.set(database=f"{stem}.shard{i}.{ext}").render_as_string(hide_password=False)
+                       for i in range(1, count)]
+
+
+class ShardMap:
+    def __init__(self, count: int):
+        self.count = count
+        self.engines: list = []
+
+    def init_app(self, app, db):
+        app.extensions["shards"] = self
+        self.engines = [db.engines[None]] + [db.engines[f"shard{i}"] for i in range(1, self.count)]
+
+    def home(self, code: str) -> int:
+        return shard_for(code, self.count)
+
+    def search_order(self, code: str) -> list[int]:
+        """先找家，再找其他分片。"""
+        home = self.home(code)
+        return [home] + [i for i in range(self.count) if i != home]
+
+    @staticmethod
+    def group_tables(metadata) -> list[Table]:
+        return [t for t in metadata.sorted_tables if t.name not in GLOBAL_TABLES]
+
+
+def _shards() -> ShardMap | None:
+    shards = current_app.extensions.get("shards") if has_app_context() else None
+    return shards if shards and shards.count > 1 else None
+
+
+def current_shard() -> int:
+    return g.get("shard", 0) if has_app_context() else 0
+
+
+def use_shard(index: int):
+    """切換之後的群組資料表查詢到第 index 個分片；切換前先 flush，待寫入的物件留在原本的分片。"""
+    if index == current_shard():
+        return
+    session = current_app.extensions["sqlalchemy"].session
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    g.shard = index
+
+
+@contextmanager
+def shard_context(index: int):
+    previous = current_shard()
+    use_shard(index)
+    try:
+        yield index
+    finally:
+        use_shard(previous)
+
+
+def each_shard():
+    """背景工作用：依序切到每個分片（未啟用分片時只跑一次）。"""
+    shards = _shards()
+    for index in range(shards.count if shards else 1):
+        with shard_context(index):
+            yield index
+
+
+def current_engine(db):
+    """群組資料表目前所在分片的 engine（給不經過 session 的獨立連線用）。"""
+    shards = _shards()
+    return shards.engines[current_shard()] if shards else db.engine
+
+
+def statement_tables(mapper, clause) -> list[Table]:
+    """get_bind 收到的 mapper / 語句涉及的資料表。"""
+    if mapper is not None:
+        return [mapper.local_table]
+    if isinstance(clause, Table):
+        return [clause]
+    if isinstance(clause, UpdateBase):
+        return [clause.table]
+    if clause is not None:
+        return [t for t in find_tables(clause, include_crud=True) if isinstance(t, Table)]
+    return []
+
+
+def _group_table(mapper, clause) -> bool:
+    return any(t.name not in GLOBAL_TABLES for t in statement_tables(mapper, clause))
+
+
+class ShardedSession(flask_sqlalchemy.session.Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            mapper = inspect(mapper) if mapper is not None else None
+            shards = _shards()
+            if shards and _group_table(mapper, clause):
+                return shards.engines[current_shard()]
+            replica = current_app.extensions.get("read_replica") if has_app_context() else None
+            if replica and (engine := replica.bind_for(self, mapper, clause)) is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# --- rebalance：把群組連同子資料搬到另一個分片 ---
+def _children(metadata, parent: Table) -> list[Table]:
+    return [t for t in metadata.sorted_tables
+            if any(fk.column.table is parent for fk in t.foreign_keys)]
+
+
+def move_group(metadata, kind: str, group_id: int, source, target) -> bool:
+    """以 Core 在兩個 engine 間搬移一個群組；先在目標 commit 再刪來源，中斷後重跑不會重複。
+
+    餐廳 id 會重新配發，子資料中指向餐廳的欄位一併換成新 id；vote_snapshot 不搬（下次開啟時重建）。
+    回傳 False 表示目標已有同代碼的群組（上次中斷時已搬過），只刪除來源。
+    """
+    group = metadata.tables[f"{kind}_group"]
+    restaurants = metadata.tables[f"{kind}_restaurant"]
+    versions = metadata.tables["group_version"]
+    children = [t for t in _children(metadata, group)
+                if t is not restaurants and t.name != "vote_snapshot"]
+    doomed = [t for t in _children(metadata, group) if t is not restaurants] + [restaurants]
+
+    with source.connect() as src:
+        row = src.execute(select(group).where(group.c.id == group_id)).mappings().first()
+        if row is None:
+            return False
+        rest_rows = src.execute(select(restaurants).where(restaurants.c.group_id == group_id)).mappings().all()
+        child_rows = {t: src.execute(select(t).where(t.c.group_id == group_id)).mappings().all() for t in children}
+        version_rows = src.execute(select(versions).where(versions.c.scope == kind,
+                                                          versions.c.group_id == group_id)).mappings().all()
+
+    moved = False
+    with target.begin() as dst:
+        if dst.execute(select(group.c.id).where(group.c.code == row["code"])).first() is None:
+            new_id = dst.execute(insert(group).values({k: v for k, v in row.items() if k != "id"})
+                                 .returning(group.c.id)).scalar_one()
+            rest_ids = {}
+            for r in rest_rows:
+                values = {k: v for k, v in r.items() if k != "id"} | {"group_id": new_id}
+                rest_ids[r["id"]] = dst.execute(insert(restaurants).values(values)
+                                                .returning(restaurants.c.id)).scalar_one()
+            for table, rows in child_rows.items():
+                rest_cols = [fk.parent.name for fk in table.foreign_keys if fk.column.table is restaurants]
+                values = []
+                for r in rows:
+                    v = {k: x for k, x in r.items() if k != "id"} | {"group_id": new_id}
+                    if any(v[c] not in rest_ids for c in rest_cols):
+                        continue   # 指向已刪除餐廳的殘留資料
+                    values.append(v | {c: rest_ids[v[c]] for c in rest_cols})
+                if values:
+                    dst.execute(insert(table), values)
+            if version_rows:
+                dst.execute(insert(versions), [{"scope": kind, "group_id": new_id, "version": v["version"]}
+                                               for v in version_rows])
+            moved = True
+
+    with source.begin() as src:
+        for table in doomed:
+            src.execute(delete(table).where(table.c.group_id == group_id))
+        src.execute(delete(versions).where(versions.c.scope == kind, versions.c.group_id == group_id))
+        src.execute(delete(group).where(group.c.id == group_id))
+    return moved
+
+
+def rebalance(metadata, shards: ShardMap, batch_size: int = 500) -> dict[str, int]:
+    """把每個分片中不在家的群組搬回家；回傳 {"shardA->shardB": 群組數}。"""
+    moved = {}
+    for index, engine in enumerate(shards.engines):
+        for kind in ("order", "vote"):
+            group = metadata.tables[f"{kind}_group"]
+            last_id = 0
+            while True:
+                with engine.connect() as conn:
+                    rows = conn.execute(select(group.c.id, group.c.code).where(group.c.id > last_id)
+                                        .order_by(group.c.id).limit(batch_size)).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                for group_id, code in rows:
+                    home = shards.home(code)
+                    if home != index:
+                        move_group(metadata, kind, group_id, engine, shards.engines[home])
+                        key = f"shard{index}->shard{home}"
+                        moved[key] = moved.get(key, 0) + 1
+    return moved
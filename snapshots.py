@@ -0,0 +1,50 @@
+"""已截止投票群組的結果快照。
+
+截止後票數不會再變：第一次以截止狀態開啟 /vote 時，把排名後的餐廳與票數、勝出者
+寫成 vote_snapshot 的一列 JSON，之後的瀏覽只讀這一列（群組被 sweeper 清除時一併刪除）。
+"""
+import json
+from dataclasses import dataclass
+
+from sqlalchemy import select
+
+from loaders import RestaurantView
+from models import db, dialect_insert, VoteRestaurant, VoteResult, VoteSnapshot
+
+
+@dataclass(frozen=True)
+class ResultSnapshot:
+    restaurants: tuple[RestaurantView, ...]   # 依票數高到低、同票依名稱
+    votes: dict[int, int]
+    winner_ids: frozenset[int]
+
+
+def _decode(data: str) -> ResultSnapshot:
+    raw = json.loads(data)
+    restaurants = tuple(RestaurantView(*r[:5]) for r in raw["restaurants"])
+    return ResultSnapshot(restaurants=restaurants,
+                          votes={r[0]: r[5] for r in raw["restaurants"]},
+                          winner_ids=frozenset(raw["winners"]))
+
+
+def load_snapshot(group_id: int) -> ResultSnapshot | None:
+    data = db.session.scalar(select(VoteSnapshot.data).where(VoteSnapshot.group_id == group_id))
+    return _decode(data) if data is not None else None
+
+
+def freeze_results(group_id: int) -> ResultSnapshot:
+    """計算並寫入快照（已存在則沿用先寫入的那份），由呼叫端 commit。"""
+    rows = db.session.execute(
+        select(VoteRestaurant.id, VoteRestaurant.name, VoteRestaurant.phone, VoteRestaurant.hours,
+               VoteRestaurant.menu_url, db.func.coalesce(VoteResult.votes, 0))
+        .outerjoin(VoteResult, (VoteResult.vote_restaurant_id == VoteRestaurant.id)
+                   & (VoteResult.group_id == group_id))
+        .where(VoteRestaurant.group_id == group_id)).all()
+    ranked = sorted(rows, key=lambda r: (-r[5], r[1]))
+    top = ranked[0][5] if ranked else 0
+    data = json.dumps({"restaurants": [list(r) for r in ranked],
+                       "winners": [r[0] for r in ranked if top > 0 and r[5] == top]},
+                      ensure_ascii=False, separators=(",", ":"))
+    db.session.execute(dialect_insert(VoteSnapshot).values(group_id=group_id, data=data)
+                       .on_conflict_do_nothing(index_elements=["group_id"]))
+    return load_snapshot(group_id)
@@ -0,0 +1,91 @@
+"""過期的聚餐投票群組清理（取代 /vote 讀取時順手刪除）。
+
+可用 `flask sweep-expired` 手動／排程執行，或設定 SWEEP_INTERVAL_SECONDS
+讓每個行程在背景定時清理（啟用伺服器端 session 時順便刪除過期的 session；
+設定 ARCHIVE_IDLE_DAYS 時也封存閒置的訂餐群組，見 retention.py）。
+"""
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from models import (db, VoteGroup, VoteGroupMeta, VoteRestaurant, VoteResult,
+                    VoteComment, VoteLedger, VoteSnapshot, GroupVersion)
+from retention import archive_idle_order_groups
+from sharding import each_shard
+
+log = logging.getLogger(__name__)
+
+TAIPEI = timezone(timedelta(hours=8))
+
+# 刪除順序：先子表再群組本身
+VOTE_GROUP_CHILDREN = (VoteSnapshot, VoteLedger, VoteComment, VoteResult, VoteRestaurant, VoteGroupMeta)
+
+
+def expiry_cutoff_utc(now: datetime | None = None) -> datetime:
+    """群組在聚餐當天（台北時間）23:59 過期 → event_at 早於回傳時間點者皆已過期。"""
+    now = now or datetime.now(timezone.utc)
+    local = (now + timedelta(minutes=1)).astimezone(TAIPEI)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(timezone.utc)
+
+
+def sweep_expired_vote_groups(now: datetime | None = None, batch_size: int = 200) -> dict[str, int]:
+    """分批刪除所有過期群組及其關聯資料（每個分片依序處理），回傳各資料表刪除筆數。"""
+    cutoff = expiry_cutoff_utc(now).replace(tzinfo=None)  # 資料庫內為 naive UTC
+    removed = Counter()
+    for _ in each_shard():
+        while True:
+            rows = (db.session.query(VoteGroupMeta.group_id, VoteGroup.code)
+                    .join(VoteGroup, VoteGroup.id == VoteGroupMeta.group_id)
+                    .filter(VoteGroupMeta.event_at < cutoff)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            ids = [gid for gid, _ in rows]
+            for model in VOTE_GROUP_CHILDREN:
+                removed[model.__tablename__] += (model.query.filter(model.group_id.in_(ids))
+                                                 .delete(synchronize_session=False))
+            removed[GroupVersion.__tablename__] += (GroupVersion.query
+                                                    .filter(GroupVersion.scope == "vote",
+                                                            GroupVersion.group_id.in_(ids))
+                                                    .delete(synchronize_session=False))
+            removed[VoteGroup.__tablename__] += (VoteGroup.query.filter(VoteGroup.id.in_(ids))
+                                                 .delete(synchronize_session=False))
+            db.session.commit()
+            cache = current_app.extensions.get("group_cache")
+            if cache:
+                for _, code in rows:
+                    cache.invalidate("vote", code)
+    return {table: n for table, n in removed.items() if n}
+
+
+def start_sweeper(app, interval: float):
+    """在背景執行緒每 interval 秒清理一次（每個 worker 各一條；刪除可重複執行，不會衝突）。"""
+    def run():
+        while True:
+            stop.wait(interval)
+            if stop.is_set():
+                return
+            with app.app_context():
+                try:
+                    removed = sweep_expired_vote_groups()
+                    if removed:
+                        log.info("expired vote groups swept: %s", removed)
+                    if app.config.get("ARCHIVE_IDLE_DAYS", 0) > 0 and (
+                            moved := archive_idle_order_groups(app.config["ARCHIVE_IDLE_DAYS"])):
+                        log.info("idle order groups archived: %s", moved)
+                    store = app.extensions.get("session_store")
+                    if store and (purged := store.purge()):
+                        log.info("stale server sessions purged: %d", purged)
+                except Exception:
+                    db.session.rollback()
+                    log.exception("expired vote group sweep failed")
+                finally:
+                    db.session.remove()
+
+    stop = threading.Event()
+    threading.Thread(target=run, name="vote-group-sweeper", daemon=True).start()
+    return stop
@@ -0,0 +1,161 @@
+"""票數的 write-behind 緩衝（選用，設定 TALLY_WRITE_BEHIND_MS 啟用）。
+
+截止前大量投票時，每張票都去更新同一筆 VoteResult 會在那一列的鎖上排隊。
+啟用後：vote_ledger 照常逐票寫入（仍是唯一可信來源），票數增量先累積在記憶體，
+每 N 毫秒（或群組截止時）一次批次寫回 VoteResult。/vote 讀取時會合併尚未寫回的增量。
+增量只在記憶體裡，worker 被強制結束就會遺失；reconcile 以 ledger 重算 VoteResult，
+在凍結結果快照前與啟動時（已截止、尚未凍結的群組）各對一次帳。
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, exists, func, select
+
+from models import (db, dialect_insert, GroupVersion, VoteGroupMeta, VoteLedger, VoteRestaurant, VoteResult,
+                    VoteSnapshot)
+from sharding import current_shard, each_shard, shard_context
+
+log = logging.getLogger(__name__)
+
+
+class TallyBuffer:
+    def __init__(self, app, interval_ms: int):
+        self.app = app
+        self.interval = interval_ms / 1000
+        # (分片, 群組 id) → restaurant_id → 增量；呼叫端一律傳群組 id，分片取自目前的請求（見 sharding.py）
+        self._pending: dict[tuple[int, int], dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name="tally-flusher", daemon=True).start()
+        atexit.register(self.close)
+
+    def add(self, group_id: int, restaurant_id: int, n: int = 1):
+        with self._lock:
+            self._pending[(current_shard(), group_id)][restaurant_id] += n
+
+    def pending(self, group_id: int) -> dict[int, int]:
+        """尚未寫回的增量（restaurant_id → 票數），讀取時與 VoteResult 相加。"""
+        with self._lock:
+            return dict(self._pending.get((current_shard(), group_id)) or {})
+
+    def discard(self, group_id: int, restaurant_id: int):
+        """餐廳被刪除時丟掉它的增量，避免寫回時又建立 VoteResult。"""
+        key = (current_shard(), group_id)
+        with self._lock:
+            if key in self._pending:
+                self._pending[key].pop(restaurant_id, None)
+
+    def flush(self, group_id: int | None = None):
+        """把增量寫回 VoteResult（group_id=None → 全部），同一交易內一次 executemany。"""
+        with self._lock:
+            if group_id is None:
+                taken, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            else:
+                key = (current_shard(), group_id)
+                taken = {key: self._pending.pop(key)} if key in self._pending else {}
+        by_shard = defaultdict(dict)
+        for (shard, gid), per_rest in taken.items():
+            rows = [{"g": gid, "r": rid, "n": n} for rid, n in per_rest.items() if n]
+            if rows:
+                by_shard[shard][gid] = rows
+        if not by_shard:
+            return
+        try:
+            for shard, groups in by_shard.items():
+                with shard_context(shard):
+                    db.session.connection(bind_arguments={"mapper": VoteResult}).execute(
+                        _upsert_statement(), [row for rows in groups.values() for row in rows])
+                    for gid in groups:
+                        _bump_version(gid)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:   # 寫回失敗：放回緩衝，下次再試
+                for shard, groups in by_shard.items():
+                    for gid, rows in groups.items():
+                        for row in rows:
+                            self._pending[(shard, gid)][row["r"]] += row["n"]
+            raise
+
+    def close(self):
+        self._stop.set()
+        with self.app.app_context():
+            self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception("tally flush failed; will retry")
+                finally:
+                    db.session.remove()
+
+
+def reconcile(group_ids: list[int]) -> int:
+    """以 vote_ledger 的票數重算這些群組（目前分片）的 VoteResult，回傳修正的餐廳數；由呼叫端 commit。
+
+    只能用在已截止、各 worker 的增量都已寫回的群組：否則別的 worker 之後寫回時會重複計算。
+    """
+    if not group_ids:
+        return 0
+    counted = {(gid, rid): n for gid, rid, n in db.session.execute(
+        select(VoteLedger.group_id, VoteLedger.vote_restaurant_id, func.count())
+        .where(VoteLedger.group_id.in_(group_ids))
+        .group_by(VoteLedger.group_id, VoteLedger.vote_restaurant_id))}
+    stored = {(gid, rid): n for gid, rid, n in db.session.execute(
+        select(VoteResult.group_id, VoteResult.vote_restaurant_id, VoteResult.votes)
+        .where(VoteResult.group_id.in_(group_ids)))}
+    rows = [{"group_id": gid, "vote_restaurant_id": rid, "votes": counted.get((gid, rid), 0)}
+            for gid, rid in counted.keys() | stored.keys()
+            if counted.get((gid, rid), 0) != stored.get((gid, rid), 0)]
+    if not rows:
+        return 0
+    stmt = dialect_insert(VoteResult)
+    db.session.connection(bind_arguments={"mapper": VoteResult}).execute(
+        stmt.on_conflict_do_update(index_elements=["group_id", "vote_restaurant_id"],
+                                   set_={"votes": stmt.excluded.votes}), rows)
+    for gid in {row["group_id"] for row in rows}:
+        _bump_version(gid)
+    log.warning("reconciled %d vote tallies from the ledger (groups %s)", len(rows),
+                sorted({row["group_id"] for row in rows}))
+    return len(rows)
+
+
+def reconcile_closed(grace: timedelta, batch_size: int = 200) -> int:
+    """啟動時呼叫：已截止超過 grace、還沒凍結快照的群組逐批對帳並 commit（每個分片依序處理）。
+
+    截止前的群組不在這裡處理（其他 worker 可能還有增量），等凍結快照前再對帳。
+    """
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - grace   # 資料庫內為 naive UTC
+    fixed = 0
+    for _ in each_shard():
+        ids = db.session.scalars(
+            select(VoteGroupMeta.group_id)
+            .where(VoteGroupMeta.vote_deadline < cutoff,
+                   ~exists().where(VoteSnapshot.group_id == VoteGroupMeta.group_id))).all()
+        for i in range(0, len(ids), batch_size):
+            fixed += reconcile(ids[i:i + batch_size])
+            db.session.commit()
+    return fixed
+
+
+def _bump_version(group_id: int):
+    db.session.execute(dialect_insert(GroupVersion)
+                       .values(scope="vote", group_id=group_id, version=1)
+                       .on_conflict_do_update(index_elements=["scope", "group_id"],
+                                              set_={"version": GroupVersion.version + 1}))
+
+
+def _upsert_statement():
+    """votes = votes + n；餐廳已被刪除（或群組已清理）時不寫入。"""
+    g, r, n = (bindparam(k, type_=db.Integer) for k in ("g", "r", "n"))
+    stmt = dialect_insert(VoteResult).from_select(
+        ["group_id", "vote_restaurant_id", "votes"],
+        select(g, r, n).where(exists().where(VoteRestaurant.id == r, VoteRestaurant.group_id == g)))
+    return stmt.on_conflict_do_update(index_elements=["group_id", "vote_restaurant_id"],
+                                      set_={"votes": VoteResult.votes + stmt.excluded.votes})
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """以暫存 SQLite 檔建立 app；額外的環境變數以關鍵字參數傳入。"""
+    def make(**env):
+        defaults = {"DATABASE_URL": f"sqlite:///{tmp_path / 'app.db'}", "ASSET_AUTOBUILD": "0",
+                    "RATE_LIMIT_COMMENT": "0", "RATE_LIMIT_VOTE": "0"}
+        for key, value in {**defaults, **env}.items():
+            monkeypatch.setenv(key, str(value))
+        from app import create_app
+        return create_app()
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+def new_vote_group(client, restaurants=("A", "B", "C"), votes_per_person=3,
+                   deadline="2099-01-01T10:00", event_at="2099-01-01T12:00") -> str:
+    resp = client.post("/group/new?scope=vote", data={
+        "event_at": event_at, "vote_deadline": deadline, "votes_per_person": str(votes_per_person)})
+    code = resp.headers["Location"].split("code=")[1]
+    for name in restaurants:
+        client.post(f"/vg/{code}/restaurants/new", data={"name": name})
+    return code
+
+
+def new_order_group(client, restaurants=("A", "B", "C")) -> str:
+    resp = client.post("/group/new?scope=order", data={"name": "lunch"})
+    code = resp.headers["Location"].split("code=")[1]
+    for name in restaurants:
+        client.post(f"/og/{code}/restaurants/new", data={"name": name})
+    return code
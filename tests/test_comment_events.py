@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import new_order_group
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_sse_only_when_enabled(make_app, enabled):
+    app = make_app(SSE_ENABLED="1" if enabled else "0", SSE_STREAM_SECONDS="0")
+    client = app.test_client()
+    code = new_order_group(client)
+    page = client.get(f"/order?code={code}").get_data(as_text=True)
+    events = f"/og/{code}/comments/events"
+
+    assert (f'const eventsUrl = "{events}"' in page) is enabled
+    assert ("const eventsUrl = null" in page) is not enabled
+    resp = client.get(events)
+    assert resp.status_code == (200 if enabled else 404)
+    if enabled:
+        assert resp.mimetype == "text/event-stream"
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, inspect, select
+
+import votes
+from conftest import new_vote_group
+from models import db, VoteGroup, VoteLedger, VoteRestaurant
+
+# 改版前的兩張表（欄位與舊版 models 相同；外鍵省略）
+legacy = MetaData()
+vote_token = Table("vote_token", legacy,
+                   Column("id", Integer, primary_key=True),
+                   Column("group_id", Integer, nullable=False),
+                   Column("client_id", String(64), nullable=False),
+                   Column("vote_restaurant_id", Integer, nullable=False),
+                   Column("created_at", DateTime, nullable=False))
+vote_ballot = Table("vote_ballot", legacy,
+                    Column("id", Integer, primary_key=True),
+                    Column("group_id", Integer, nullable=False),
+                    Column("nickname", String(10), nullable=False),
+                    Column("vote_restaurant_id", Integer, nullable=False),
+                    Column("created_at", DateTime, nullable=False))
+
+
+def test_migrate_legacy_votes_keeps_nicknames(app):
+    code = new_vote_group(app.test_client())
+    with app.app_context():
+        legacy.create_all(db.engine)
+        group_id = db.session.scalar(select(VoteGroup.id).where(VoteGroup.code == code))
+        a, b, c = db.session.scalars(select(VoteRestaurant.id).where(VoteRestaurant.group_id == group_id)
+                                     .order_by(VoteRestaurant.id)).all()
+        # 舊版每票先寫 token 再寫 ballot，兩者的 created_at 各自取預設值（差幾微秒）
+        t = datetime(2024, 5, 1, 11, 0)
+        with db.engine.begin() as conn:
+            for i, (client, nick, rid) in enumerate([("c0", "nick0", a), ("c1", "nick1", a), ("c0", "nick0", b),
+                                                     ("c2", "nick2", b), ("c2", "nick2", a), ("c1", "nick1", c)]):
+                at = t + timedelta(seconds=i)
+                conn.execute(insert(vote_token).values(group_id=group_id, client_id=client,
+                                                       vote_restaurant_id=rid, created_at=at))
+                conn.execute(insert(vote_ballot).values(group_id=group_id, nickname=nick, vote_restaurant_id=rid,
+                                                        created_at=at + timedelta(microseconds=37)))
+
+        assert votes.migrate_legacy_votes() == 6
+
+        rows = db.session.execute(select(VoteLedger.client_id, VoteLedger.nickname, VoteLedger.vote_restaurant_id,
+                                         VoteLedger.slot).order_by(VoteLedger.id)).all()
+        assert {(r.client_id, r.nickname) for r in rows} == {("c0", "nick0"), ("c1", "nick1"), ("c2", "nick2")}
+        assert sorted((r.client_id, r.vote_restaurant_id, r.slot) for r in rows) == sorted([
+            ("c0", a, 1), ("c0", b, 2), ("c1", a, 1), ("c1", c, 2), ("c2", b, 1), ("c2", a, 2)])
+        assert not inspect(db.engine).has_table("vote_token")
+        assert not inspect(db.engine).has_table("vote_ballot")
+        assert votes.migrate_legacy_votes() is None
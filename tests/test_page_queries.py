@@ -0,0 +1,57 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from conftest import new_order_group, new_vote_group
+from models import db
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def page_queries(app, client, url) -> int:
+    client.get(url)   # 暖機：群組快取、最後開啟時間等一次性的查詢不算
+    with count_queries(app) as statements:
+        assert client.get(url).status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize("scope", ["order", "vote"])
+def test_page_query_count_does_not_grow(app, scope):
+    admin, viewer = app.test_client(), app.test_client()
+    if scope == "order":
+        code = new_order_group(admin, restaurants=["R0"])
+    else:
+        code = new_vote_group(admin, restaurants=["R0"])
+    prefix = "og" if scope == "order" else "vg"
+    url = f"/{scope}?code={code}"
+    small = page_queries(app, viewer, url)
+
+    for i in range(1, 10):
+        admin.post(f"/{prefix}/{code}/restaurants/new", data={"name": f"R{i}"})
+    for i in range(30):
+        admin.post(f"/{prefix}/{code}/comments", data={"nickname": "n", "message": f"m{i}"})
+    if scope == "vote":
+        page = admin.get(url).get_data(as_text=True)
+        for rid in sorted(set(re.findall(rf"/vg/{code}/vote/(\d+)", page)))[:3]:
+            admin.post(f"/vg/{code}/vote/{rid}")
+
+    html = viewer.get(url).get_data(as_text=True)
+    assert "R9" in html   # 10 家餐廳都在頁面上
+    assert page_queries(app, viewer, url) == small
+    assert small == 1, small   # 餐廳、常訂／票數一句查詢（群組在快取內）
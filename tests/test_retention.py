@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+
+from conftest import new_order_group
+from models import db, OrderComment, OrderFavorite, OrderGroup, OrderGroupArchive, OrderRestaurant
+from retention import archive_idle_order_groups
+
+LATER = datetime.now() + timedelta(days=400)
+
+
+def archive_elsewhere(app, monkeypatch):
+    """封存所有群組，但保留這個 worker 的 group_cache：模擬另一個 worker 封存、這裡還拿著舊的 GroupRef。"""
+    monkeypatch.setattr(app.extensions["group_cache"], "invalidate", lambda kind, code: None)
+    with app.app_context():
+        moved = archive_idle_order_groups(30, now=LATER)
+    monkeypatch.undo()
+    return moved
+
+
+def group_children(app, code):
+    with app.app_context():
+        group = OrderGroup.query.filter_by(code=code).one()
+        return ({r.name for r in OrderRestaurant.query.filter_by(group_id=group.id)},
+                OrderFavorite.query.filter_by(group_id=group.id).count(),
+                [c.message for c in OrderComment.query.filter_by(group_id=group.id)])
+
+
+def test_comment_on_stale_cached_group_restores_it(app, monkeypatch):
+    client = app.test_client()
+    code = new_order_group(client)
+    client.post(f"/og/{code}/comments", data={"nickname": "amy", "message": "before"})
+    assert client.get(f"/order?code={code}").status_code == 200   # 快取 GroupRef
+    assert archive_elsewhere(app, monkeypatch)["order_group"] == 1
+
+    resp = client.post(f"/og/{code}/comments", data={"message": "after"})
+    assert resp.status_code == 302
+    restaurants, _, comments = group_children(app, code)
+    assert restaurants == {"A", "B", "C"}
+    assert comments == ["before", "after"]
+    with app.app_context():
+        assert OrderGroupArchive.query.count() == 0
+
+
+def test_api_write_on_stale_cached_group_restores_it(app, monkeypatch):
+    client = app.test_client()
+    code = new_order_group(client)
+    with app.app_context():
+        rid = db.session.scalar(db.select(OrderRestaurant.id).filter_by(name="A"))
+    client.post(f"/og/{code}/favorite/{rid}/toggle")
+    archive_elsewhere(app, monkeypatch)
+
+    resp = client.post(f"/api/v1/og/{code}/favorites", json={"add": [], "remove": []})
+    assert resp.status_code == 200
+    assert len(resp.get_json()["favorites"]) == 1   # 讀的是還原後的群組，不是已刪除的舊 id
+    assert group_children(app, code)[1] == 1
+
+
+def test_archive_skips_group_opened_after_selection(app):
+    client = app.test_client()
+    code = new_order_group(client)
+    engine, fired = None, []
+
+    def touch_first(conn, cursor, statement, parameters, context, executemany):
+        # 挑出候選之後、鎖住之前，另一個連線剛好開啟了群組
+        if statement.startswith("UPDATE order_group") and not fired:
+            fired.append(statement)
+            with engine.begin() as other:
+                other.execute(update(OrderGroup).values(last_active_at=LATER))
+
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, "before_cursor_execute", touch_first)
+        try:
+            assert archive_idle_order_groups(30, now=LATER - timedelta(days=1)) == {}
+        finally:
+            event.remove(engine, "before_cursor_execute", touch_first)
+    assert fired
+    assert group_children(app, code)[0] == {"A", "B", "C"}
+
+
+def test_restore_on_other_shard(make_app):
+    app = make_app(SQLITE_SHARDS="3")
+    client = app.test_client()
+    codes = [new_order_group(client, restaurants=(f"R{i}",)) for i in range(6)]
+    with app.app_context():
+        assert archive_idle_order_groups(30, now=LATER)["order_group"] == 6
+        shards = {app.extensions["shards"].home(code) for code in codes}
+    assert len(shards) > 1   # 至少有群組不在分片 0
+
+    for i, code in enumerate(codes):
+        page = client.get(f"/order?code={code}")
+        assert page.status_code == 200
+        body = page.get_data(as_text=True)
+        assert f"/og/{code}/comments" in body and f"R{i}" in body
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from conftest import new_vote_group
+from models import db, VoteGroup, VoteGroupMeta
+
+
+def close_group(app, code):
+    with app.app_context():
+        group_id = db.session.scalar(select(VoteGroup.id).where(VoteGroup.code == code))
+        db.session.execute(update(VoteGroupMeta).where(VoteGroupMeta.group_id == group_id)
+                           .values(vote_deadline=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+    app.extensions["group_cache"].clear()
+
+
+def test_closed_page_revalidates_with_etag(app):
+    client = app.test_client()
+    code = new_vote_group(client)
+    close_group(app, code)
+    client.get(f"/vote?code={code}")   # 消化建立群組時的一次性訊息（no-store）
+
+    first = client.get(f"/vote?code={code}")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    etag = first.headers["ETag"]
+
+    again = client.get(f"/vote?code={code}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["Cache-Control"] == "private, no-cache"
+
+    # 改了暱稱：同一個 ETag 不能再回 304
+    client.post(f"/vg/{code}/comments", data={"nickname": "amy", "message": "hi"})
+    client.get(f"/vote?code={code}")   # 消化留言後的一次性訊息（no-store）
+    changed = client.get(f"/vote?code={code}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
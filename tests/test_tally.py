@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from conftest import new_vote_group
+from models import db, VoteGroup, VoteGroupMeta, VoteRestaurant, VoteResult
+
+
+def lose_pending_and_close(app, code):
+    """模擬 worker 被強制結束：緩衝中的增量沒寫回，之後投票截止。"""
+    app.extensions["tally_buffer"]._pending.clear()
+    with app.app_context():
+        group_id = db.session.scalar(select(VoteGroup.id).where(VoteGroup.code == code))
+        db.session.execute(update(VoteGroupMeta).where(VoteGroupMeta.group_id == group_id)
+                           .values(vote_deadline=datetime.utcnow() - timedelta(days=1)))
+        db.session.commit()
+    app.extensions["group_cache"].clear()   # 快取裡的 meta 還是原本的截止時間
+    return group_id
+
+
+def tallies(app, group_id):
+    with app.app_context():
+        return dict(db.session.execute(
+            select(VoteRestaurant.name, VoteResult.votes)
+            .join(VoteRestaurant, VoteRestaurant.id == VoteResult.vote_restaurant_id)
+            .where(VoteResult.group_id == group_id)).all())
+
+
+def cast_votes(app, code):
+    """兩個人投 A，其中一人再投 B。"""
+    with app.app_context():
+        rids = db.session.scalars(select(VoteRestaurant.id).join(VoteGroup, VoteGroup.id == VoteRestaurant.group_id)
+                                  .where(VoteGroup.code == code).order_by(VoteRestaurant.id)).all()
+    first, second = app.test_client(), app.test_client()
+    for client, rid in ((first, rids[0]), (second, rids[0]), (first, rids[1])):
+        assert client.post(f"/vg/{code}/vote/{rid}").status_code == 302
+    return first
+
+
+def test_freeze_reconciles_lost_increments(make_app):
+    app = make_app(TALLY_WRITE_BEHIND_MS="3600000")   # 測試期間不自動寫回
+    code = new_vote_group(app.test_client())
+    client = cast_votes(app, code)
+    group_id = lose_pending_and_close(app, code)
+    assert tallies(app, group_id) == {}
+
+    assert client.get(f"/vote?code={code}").status_code == 200   # 截止：凍結結果快照
+    assert tallies(app, group_id) == {"A": 2, "B": 1}
+
+
+def test_startup_reconciles_closed_groups(make_app):
+    app = make_app(TALLY_WRITE_BEHIND_MS="3600000")
+    code = new_vote_group(app.test_client())
+    cast_votes(app, code)
+    group_id = lose_pending_and_close(app, code)
+    assert tallies(app, group_id) == {}
+
+    restarted = make_app(TALLY_WRITE_BEHIND_MS="3600000")
+    assert tallies(restarted, group_id) == {"A": 2, "B": 1}
@@ -0,0 +1,88 @@
+import threading
+
+from sqlalchemy import func, select
+
+from conftest import new_vote_group
+from models import db, VoteGroup, VoteLedger, VoteRestaurant, VoteResult
+
+
+def group_state(app, code):
+    with app.app_context():
+        group_id = db.session.scalar(select(VoteGroup.id).where(VoteGroup.code == code))
+        rids = db.session.scalars(select(VoteRestaurant.id).where(VoteRestaurant.group_id == group_id)
+                                  .order_by(VoteRestaurant.id)).all()
+        return group_id, rids
+
+
+def run_at_once(jobs):
+    """所有 job 在同一瞬間開始（Barrier），全部結束後回傳例外清單。"""
+    barrier = threading.Barrier(len(jobs))
+    errors = []
+
+    def run(job):
+        try:
+            barrier.wait()
+            job()
+        except Exception as exc:   # 執行緒內的例外不會自己浮出來
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(job,)) for job in jobs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def client_as(app, cid):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["cid"] = cid
+    return client
+
+
+def test_concurrent_voters_counted_exactly(app):
+    code = new_vote_group(app.test_client())
+    group_id, rids = group_state(app, code)
+    voters = [client_as(app, f"voter-{i}") for i in range(50)]
+
+    def vote(client):
+        def job():
+            for rid in rids:
+                assert client.post(f"/vg/{code}/vote/{rid}").status_code == 302
+        return job
+
+    assert run_at_once([vote(c) for c in voters]) == []
+
+    with app.app_context():
+        tally = dict(db.session.execute(select(VoteResult.vote_restaurant_id, VoteResult.votes)
+                                        .where(VoteResult.group_id == group_id)).all())
+        ledger = dict(db.session.execute(select(VoteLedger.vote_restaurant_id, func.count())
+                                         .where(VoteLedger.group_id == group_id)
+                                         .group_by(VoteLedger.vote_restaurant_id)).all())
+    assert tally == {rid: 50 for rid in rids}
+    assert ledger == {rid: 50 for rid in rids}
+
+
+def test_parallel_votes_from_one_client_stay_within_quota(app):
+    code = new_vote_group(app.test_client(), restaurants=[f"R{i}" for i in range(8)], votes_per_person=2)
+    group_id, rids = group_state(app, code)
+    # 同一個 cid 的多個分頁同時按下不同餐廳，還有重複按同一家
+    clients = [client_as(app, "greedy") for _ in range(12)]
+    targets = rids + rids[:4]
+
+    def vote(client, rid):
+        return lambda: client.post(f"/vg/{code}/vote/{rid}")
+
+    assert run_at_once([vote(c, rid) for c, rid in zip(clients, targets)]) == []
+
+    with app.app_context():
+        slots = db.session.scalars(select(VoteLedger.slot).where(VoteLedger.group_id == group_id,
+                                                                 VoteLedger.client_id == "greedy")).all()
+        ballots = db.session.scalars(select(VoteLedger.vote_restaurant_id)
+                                     .where(VoteLedger.group_id == group_id)).all()
+        total = db.session.scalar(select(func.coalesce(func.sum(VoteResult.votes), 0))
+                                  .where(VoteResult.group_id == group_id))
+    assert len(slots) <= 2 and sorted(slots) == list(range(1, len(slots) + 1))
+    assert len(set(ballots)) == len(ballots)   # 同一家不會算兩次
+    assert total == len(slots) >= 1
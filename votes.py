@@ -0,0 +1,117 @@
+"""投票寫入：重複投票、配額與截止檢查都在資料庫內一次 INSERT 完成。
+
+每一票只寫 vote_ledger 一列（INSERT ... SELECT ... ON CONFLICT DO NOTHING），加上 VoteResult 的累加：
+- 條件：此人沒投過這家、已用票數 < votes_per_person、未截止、餐廳屬於此群組
+- slot = 此人目前最大的 slot + 1，(group_id, client_id, slot) 唯一
+  → 同一人同時送出多票時看到的是同一個最大值，搶到同一個 slot 的只有一筆會成功，
+    所以上面兩個條件不會因為並行而被繞過；餐廳刪除後留下的空號也不會卡住
+票數則用 upsert 的 votes = votes + 1，不再讀出來改完再寫回。
+舊版的 vote_token / vote_ballot 兩張表用 `flask votes migrate-ledger` 搬進帳本（見 migrate_legacy_votes）。
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import exists, func, inspect, literal, select, text
+
+from models import db, dialect_insert, VoteGroupMeta, VoteRestaurant, VoteResult, VoteLedger
+
+CAST = "cast"
+ALREADY_VOTED = "already_voted"
+QUOTA_USED = "quota_used"
+CLOSED = "closed"
+BUSY = "busy"
+NOT_FOUND = "not_found"
+
+
+def cast_vote(group_id: int, restaurant_id: int, client_id: str, nickname: str,
+              now: datetime | None = None, update_tally: bool = True) -> str:
+    """寫入一票（不 commit，由呼叫端 commit）；失敗時 rollback 並回傳原因。
+
+    update_tally=False 時不動 VoteResult（由 tally.TallyBuffer 之後批次寫回）。
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None)
+
+    mine = (VoteLedger.group_id == group_id) & (VoteLedger.client_id == client_id)
+    used = select(func.count()).select_from(VoteLedger).where(mine).scalar_subquery()
+    last_slot = select(func.coalesce(func.max(VoteLedger.slot), 0)).where(mine).scalar_subquery()
+    fresh = ~exists().where(mine, VoteLedger.vote_restaurant_id == restaurant_id)
+    limit = func.coalesce(select(VoteGroupMeta.votes_per_person)
+                          .where(VoteGroupMeta.group_id == group_id)
+                          .scalar_subquery(), 1)
+    is_open = ~exists().where(VoteGroupMeta.group_id == group_id, VoteGroupMeta.vote_deadline <= now)
+    in_group = exists().where(VoteRestaurant.id == restaurant_id, VoteRestaurant.group_id == group_id)
+
+    ballot = (dialect_insert(VoteLedger)
+              .from_select(["group_id", "client_id", "nickname", "vote_restaurant_id", "slot", "created_at"],
+                           select(literal(group_id), literal(client_id), literal(nickname), literal(restaurant_id),
+                                  last_slot + 1, literal(now, db.DateTime))
+                           .where(used < limit, fresh, is_open, in_group))
+              .on_conflict_do_nothing())
+    if db.session.execute(ballot).rowcount != 1:
+        db.session.rollback()
+        return _rejection(group_id, restaurant_id, client_id, now)
+
+    if not update_tally:
+        return CAST
+    db.session.execute(dialect_insert(VoteResult)
+                       .values(group_id=group_id, vote_restaurant_id=restaurant_id, votes=1)
+                       .on_conflict_do_update(index_elements=["group_id", "vote_restaurant_id"],
+                                              set_={"votes": VoteResult.votes + 1}))
+    return CAST
+
+
+def _rejection(group_id, restaurant_id, client_id, now) -> str:
+    """只在投票失敗時才查：找出被拒的原因給畫面顯示。"""
+    if not db.session.query(exists().where(VoteRestaurant.id == restaurant_id,
+                                           VoteRestaurant.group_id == group_id)).scalar():
+        return NOT_FOUND
+    meta = VoteGroupMeta.query.filter_by(group_id=group_id).first()
+    if meta and meta.vote_deadline <= now:
+        return CLOSED
+    if VoteLedger.query.filter_by(group_id=group_id, client_id=client_id,
+                                  vote_restaurant_id=restaurant_id).first():
+        return ALREADY_VOTED
+    used = used_votes(group_id, client_id)
+    if used >= (meta.votes_per_person if meta else 1):
+        return QUOTA_USED
+    return BUSY
+
+
+def used_votes(group_id: int, client_id: str) -> int:
+    return db.session.scalar(select(func.count()).select_from(VoteLedger)
+                             .where(VoteLedger.group_id == group_id, VoteLedger.client_id == client_id))
+
+
+def migrate_legacy_votes() -> int | None:
+    """把舊版 vote_token（身分）與 vote_ballot（暱稱）搬進 vote_ledger，並在同一個交易內刪掉兩張舊表。
+
+    每一票的 token 與 ballot 在同一個交易內依序寫入，但兩者的 created_at 各自取預設值，幾乎不會相等；
+    所以在同一群組、同一家餐廳內把兩邊各依寫入順序（id）編號，第 n 個 token 配第 n 個 ballot 的暱稱
+    （配不到才用「訪客」）。slot 依 token 寫入順序重新編號。VoteResult 本來就是票數，不需搬。
+    沒有舊表時回傳 None。
+    """
+    if not inspect(db.engine).has_table("vote_token"):
+        return None
+    has_ballots = inspect(db.engine).has_table("vote_ballot")
+    nickname, ballots = "NULL", ""
+    if has_ballots:
+        nickname = "b.nickname"
+        ballots = """LEFT JOIN (SELECT group_id, vote_restaurant_id, nickname, ROW_NUMBER() OVER (
+                          PARTITION BY group_id, vote_restaurant_id ORDER BY id) AS pair
+                      FROM vote_ballot) b
+                ON b.group_id = t.group_id AND b.vote_restaurant_id = t.vote_restaurant_id AND b.pair = t.pair"""
+    with db.engine.begin() as conn:
+        # WHERE 1 = 1：SQLite 的 INSERT ... SELECT 後面接 ON CONFLICT 時必須有 WHERE 才不會被誤判
+        moved = conn.execute(text(f"""
+            INSERT INTO vote_ledger (group_id, client_id, nickname, vote_restaurant_id, slot, created_at)
+            SELECT t.group_id, t.client_id, COALESCE({nickname}, '訪客'), t.vote_restaurant_id,
+                   ROW_NUMBER() OVER (PARTITION BY t.group_id, t.client_id ORDER BY t.id), t.created_at
+            FROM (SELECT id, group_id, client_id, vote_restaurant_id, created_at, ROW_NUMBER() OVER (
+                      PARTITION BY group_id, vote_restaurant_id ORDER BY id) AS pair
+                  FROM vote_token) t
+            {ballots}
+            WHERE 1 = 1
+            ON CONFLICT DO NOTHING""")).rowcount
+        conn.execute(text("DROP TABLE vote_token"))
+        if has_ballots:
+            conn.execute(text("DROP TABLE vote_ballot"))
+    return moved